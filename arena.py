@@ -0,0 +1,43 @@
+'''Reusable image buffers for allocation-free processing of same size photos.'''
+
+import collections
+import threading
+
+import numpy as np
+
+class BufferArena:
+    '''Named numpy buffers reused between calls. Buffers are kept per thread and per resolution,
+    at most max_shapes resolutions are kept (least recently used resolution is dropped).'''
+    def __init__(self, max_shapes=2):
+        self.max_shapes = max_shapes
+        self.local = threading.local()
+
+    def get(self, name, shape, dtype=np.uint8):
+        '''Return buffer with given name, shape and dtype. Content is undefined (left from previous call).'''
+        shapes = getattr(self.local, 'shapes', None)
+        if shapes is None:
+            shapes = self.local.shapes = collections.OrderedDict()
+
+        # Buffers are grouped by frame resolution (height, width)
+        resolution = tuple(shape[:2])
+        buffers = shapes.get(resolution)
+        if buffers is None:
+            buffers = shapes[resolution] = {}
+            if len(shapes) > self.max_shapes:
+                shapes.popitem(last=False)
+        else:
+            shapes.move_to_end(resolution)
+
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = np.empty(shape, dtype)
+
+        return buffer
+
+    def clear(self):
+        '''Drop all buffers of current thread.'''
+        self.local.shapes = collections.OrderedDict()
+
+if __name__ == '__main__':
+    pass
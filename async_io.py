@@ -0,0 +1,119 @@
+'''Background image decoding and queued file writes, so photo I/O overlaps with processing.'''
+
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import metrics
+
+def read_images(paths, read=cv2.imread):
+    '''Decode several images at once on threads (OpenCV releases GIL while decoding). None paths give None images.
+    Counters recorded on reader threads are merged into current run (wall time is measured by caller).'''
+    def read_counted(path):
+        image = read(path) if path is not None else None
+        return image, metrics.take()[1]
+
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max(len(paths), 1)) as executor:
+        results = list(executor.map(read_counted, paths))
+
+    for _, counters in results:
+        metrics.merge({}, counters)
+    return [image for image, _ in results]
+
+def _read_measured(read, path):
+    '''Prefetch task: decode image and return it with metrics recorded on prefetch thread.'''
+    with metrics.stage('image_load'):
+        image = read(path)
+    return image, metrics.take()
+
+
+class ImagePrefetcher:
+    '''Decode object photos on background threads ahead of processing.
+    At most depth photos are decoded in advance to keep memory bounded.'''
+    def __init__(self, depth=2, workers=None, read=cv2.imread):
+        self.depth = max(depth, 1)
+        self.workers = workers or min(self.depth, 4)
+        self.read = read
+
+    def run(self, entries):
+        '''Yield (entry, decoded image or None) for (image path, ...) entries in input order.
+        Decode metrics of every photo are merged into current run of consumer thread.'''
+        pending = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for entry in entries:
+                pending.append((entry, executor.submit(_read_measured, self.read, entry[0])))
+
+                # Back-pressure: hand out oldest photo before decoding more
+                if len(pending) > self.depth:
+                    yield self._collect(*pending.popleft())
+
+            while pending:
+                yield self._collect(*pending.popleft())
+
+    @staticmethod
+    def _collect(entry, future):
+        image, (stages, counters) = future.result()
+        metrics.merge(stages, counters)
+        return entry, image
+
+
+def _write_line(output_file, line):
+    '''Append line to open file and flush it, so results are visible while batch is running.'''
+    output_file.write(line)
+    output_file.flush()
+
+
+class AsyncWriter:
+    '''Run file writes (debug images, result lines) on background thread in submission order.
+    Queue is bounded: producer waits when writer falls behind (measured as output_write stage).'''
+    def __init__(self, max_queue=8):
+        self.queue = queue.Queue(maxsize=max(max_queue, 1))
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name='async-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        '''Queue function(*args) call. Arguments must not be changed by caller after submit.'''
+        with metrics.stage('output_write'):
+            self.queue.put((function, args))
+
+    def imwrite(self, path, image):
+        '''Queue image write.'''
+        self.submit(cv2.imwrite, path, image)
+
+    def write_line(self, output_file, line):
+        '''Queue line write to open file.'''
+        self.submit(_write_line, output_file, line)
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            function, args = task
+            try:
+                function(*args)
+            # Any failed task is counted, writer keeps draining queue (otherwise submit() would block forever)
+            except Exception as error:
+                self.errors += 1
+                print('Write error: {}'.format(error))
+
+    def close(self):
+        '''Finish queued writes and stop writer thread.'''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,123 @@
+'''Batch mode: calibrate rig once and calculate zoom for many object photos.'''
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from camera_profiles import ProfileRegistry
+from pipeline import add_processing_arguments, calibrate, BatchProcessor, EscalationReport, ProcessingOptions
+from parallel import ParallelProcessor
+from calibration_cache import CalibrationCache
+from async_io import AsyncWriter
+from decode import ImageDecoder
+from disc_tracker import DiscTracker, state_path
+import metrics
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+def read_manifest(path_to_manifest, default_serial_number='None'):
+    '''Yield (object image path, camera serial number) pairs from directory, CSV or JSONL manifest.
+    CSV/JSONL records use "obj" (or "image") for object photo path and optional "sn" for serial number.
+    Relative paths are resolved against manifest directory.'''
+    if os.path.isdir(path_to_manifest):
+        for file_name in sorted(os.listdir(path_to_manifest)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                yield (os.path.join(path_to_manifest, file_name), default_serial_number)
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(path_to_manifest))
+
+    with open(path_to_manifest, newline='') as manifest_file:
+        if path_to_manifest.lower().endswith('.csv'):
+            records = csv.DictReader(manifest_file)
+        else:
+            records = (json.loads(line) for line in manifest_file if line.strip())
+
+        for record in records:
+            path_to_object_image = record.get('obj') or record.get('image')
+            if not path_to_object_image:
+                continue
+            serial_number = record.get('sn') or default_serial_number
+            yield (os.path.join(base_dir, path_to_object_image), str(serial_number))
+
+
+def main():
+    '''Batch mode entry point'''
+    parser = argparse.ArgumentParser(description='Batch zoom calculation')
+    parser.add_argument('--blue', type=str, required=True, help='Blue disc photo name')
+    parser.add_argument('--gray', type=str, required=True, help='Gray disc photo name')
+    parser.add_argument('--manifest', type=str, required=True, help='Directory with object photos or CSV/JSONL manifest')
+    parser.add_argument('--sn', type=str, default='None', help='Default camera serial number (default: None)')
+    parser.add_argument('--output', type=str, default='zoom_results.jsonl', help='JSONL file for results, "-" for stdout (default: zoom_results.jsonl)')
+    parser.add_argument('--cache', type=str, default=None, help='Calibration cache directory (default: no cache)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, 0 for all CPU cores (default: 1)')
+    parser.add_argument('--max-pending', type=int, default=None, help='Maximal number of photos in flight for workers (default: 2 * workers)')
+    add_processing_arguments(parser)
+    parser.add_argument('--compare-full', action='store_true', help='Also run full resolution path and report bounding box error and zoom index')
+    parser.add_argument('--prefetch', type=int, default=2, help='Object photos decoded ahead on background threads, 0 to disable (default: 2)')
+    parser.add_argument('--write-queue', type=int, default=8, help='Queued bounding image and result writes, 0 for synchronous writes (default: 8)')
+    parser.add_argument('--bounding-dir', type=str, default=None, help='Directory to save bounding mask images (default: not saved)')
+    args = parser.parse_args()
+
+    # Results on stdout are JSON lines only: prints of calculator and bound finder (and errors) go to stderr
+    results_file = sys.stdout
+    if args.output == '-':
+        sys.stdout = sys.stderr
+
+    metrics.enable_from_env()
+
+    # Init calculator with settings and calibrate camera once for whole batch
+    calculator = ProfileRegistry().calculator(args.sn)
+    calculator.decoder = ImageDecoder() if args.reduced_decode else None
+    calculator.load_images(args.blue, args.gray, serial_number=args.sn, read_calibration=args.cache is None)
+
+    if calculator.background_image is None:
+        print('File is not found')
+        sys.exit()
+
+    cache = CalibrationCache(args.cache) if args.cache is not None else None
+    tracker = DiscTracker(state_path(args.cache)) if args.track_disc else None
+    try:
+        calibration = calibrate(calculator, cache, tracker)
+    except ValueError as error:
+        print(error)
+        sys.exit()
+    metrics.flush({'mode': 'batch', 'run': 'calibration', 'sn': args.sn})
+
+    options = ProcessingOptions.from_args(args)
+
+    # Bounding images and result lines are written on background thread (workers write their own bounding images)
+    writer = AsyncWriter(args.write_queue) if args.write_queue > 0 else None
+
+    if args.workers == 1:
+        processor = BatchProcessor(calculator, calibration, args.bounding_dir, options, args.prefetch, writer)
+    else:
+        processor = ParallelProcessor(calculator, calibration, args.bounding_dir, args.workers or None, args.max_pending, options, quiet=args.output == '-')
+
+    report = EscalationReport()
+    output_file = results_file if args.output == '-' else open(args.output, 'w')
+    try:
+        # Stream results as JSON lines
+        for result in processor.run(read_manifest(args.manifest, args.sn)):
+            if writer is not None:
+                writer.write_line(output_file, json.dumps(result) + '\n')
+            else:
+                output_file.write(json.dumps(result) + '\n')
+                output_file.flush()
+            metrics.flush({'mode': 'batch', 'obj': result['obj'], 'sn': result['sn']})
+            report.add(result)
+    finally:
+        if writer is not None:
+            writer.close()
+        if output_file is not results_file:
+            output_file.close()
+        if args.workers != 1:
+            processor.close()
+
+    if args.segmentation == 'two_tier':
+        print(report.summary(), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+'''Accuracy against speed of alternative processing modes: every mode is compared with the reference path
+(prepare_image -> bitwise_and with fill_outside_disc mask -> find_object_bounds -> find_virtual_bounds -> calc_zoom)
+on synthetic scenes or recorded (blue, gray, object) photo triples.
+
+Per mode: bounding box IoU, object size error (mm), zoom index agreement and per-stage speedup.
+With thresholds, exit code is 1 when any mode fails them (local release gate).
+'''
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from camera_profiles import ProfileRegistry
+from bounds import BoundFinder
+from pipeline import Calibration, calibrate, BatchProcessor, ProcessingOptions, CALCULATION_ERRORS
+from rig import read_rig_manifest
+from scene import RESOLUTIONS, make_scene
+import metrics
+
+# Mode name -> ProcessingOptions arguments
+MODES = {
+    'full': {},
+    'pyramid': {'segmentation': 'pyramid', 'pyramid_scale': 4},
+    'pyramid8': {'segmentation': 'pyramid', 'pyramid_scale': 8},
+    'tiled': {'segmentation': 'tiled'},
+    'tiled_components': {'segmentation': 'tiled', 'bounds_engine': 'components'},
+    'components': {'bounds_engine': 'components'},
+    'in_place': {'in_place': True},
+    'roi': {'roi_crop': True},
+    'two_tier': {'segmentation': 'two_tier', 'first_pass_scale': 4},
+    'two_tier8': {'segmentation': 'two_tier', 'first_pass_scale': 8},
+}
+
+def synthetic_corpus(registry, resolutions, tilts, object_sizes, offsets, noises):
+    '''Yield (name, calculator, calibration, object photo) for every synthetic scene.'''
+    for megapixels, tilt_deg, object_size, object_offset, noise in itertools.product(resolutions, tilts, object_sizes, offsets, noises):
+        width, height = RESOLUTIONS[megapixels]
+        calibration_photo, background_photo, object_photo = make_scene(width, height, tilt_deg, object_size, (object_offset, object_offset), noise)
+
+        calculator = registry.calculator('synthetic')
+        calculator.serial_number = 'synthetic'
+        calculator.background_image = background_photo
+        calculator.set_calibration_image(calibration_photo)
+        calculator.select_camera_orientation()
+        calibration = Calibration.from_calculator(calculator)
+
+        name = '{}MP tilt {:g} size {:g} offset {:g} noise {}'.format(megapixels, tilt_deg, object_size, object_offset, noise)
+        yield name, calculator, calibration, object_photo
+
+def recorded_corpus(registry, path_to_manifest):
+    '''Yield (name, calculator, calibration, object photo) for every camera triple of rig manifest (sn, blue, gray, obj).'''
+    for serial_number, path_to_calibration_image, path_to_background_image, path_to_object_image in read_rig_manifest(path_to_manifest):
+        calculator = registry.calculator(serial_number)
+        calculator.load_images(path_to_calibration_image, path_to_background_image, path_to_object_image, serial_number)
+        if calculator.background_image is None or calculator.object_image is None:
+            print('File is not found: ' + path_to_object_image, file=sys.stderr)
+            continue
+
+        try:
+            calibration = quiet_calibrate(calculator)
+        except ValueError as error:
+            print(str(error) + ': ' + path_to_calibration_image, file=sys.stderr)
+            continue
+
+        yield path_to_object_image, calculator, calibration, calculator.object_image
+
+def quiet_calibrate(calculator):
+    '''Calibrate calculator with loaded images, prints of calculator are dropped.'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return calibrate(calculator)
+
+def reference_path(calculator, calibration, object_photo):
+    '''Reference chain with stages recorded under the same metrics names as process_object(). Return result dictionary like process_object().'''
+    object_bounds = BoundFinder(calculator.background_image, object_photo)
+
+    with metrics.stage('segmentation'):
+        processed_photo = object_bounds.prepare_image(9, 100)
+        processed_photo = cv2.bitwise_and(processed_photo, calibration.disc_mask)
+
+    bounds = object_bounds.find_object_bounds(processed_photo)
+    virtual_bounds = object_bounds.find_virtual_bounds(*bounds)
+
+    # Calculator methods record zoom_math stage themselves, as in process_object()
+    object_width_mm, object_height_mm = calculator.calculate_object_size(virtual_bounds[2], virtual_bounds[3], calibration.camera_distance_mm)
+    zoom_index = calculator.calc_zoom(virtual_bounds[2], virtual_bounds[3], object_width_mm, object_height_mm, calibration.camera_distance_mm, write_file=False)
+
+    return {'object_bounds': list(bounds), 'object_width_mm': object_width_mm, 'object_height_mm': object_height_mm, 'zoom_index': zoom_index}
+
+def measure(function, repeat):
+    '''Run function repeat times. Return (result, best wall time, stage wall times of best run) or (error, None, None).'''
+    best = None
+    for _ in range(repeat):
+        metrics.take()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = function()
+        except CALCULATION_ERRORS as error:
+            return {'error': str(error) or 'Calculation error'}, None, None
+        wall = time.perf_counter() - start
+        stages = {name: record[1] for name, record in metrics.take()[0].items()}
+
+        if best is None or wall < best[1]:
+            best = (result, wall, stages)
+    return best
+
+def iou(reference_bounds, bounds):
+    '''Intersection over union of two (x, y, width, height) boxes.'''
+    ref_x, ref_y, ref_width, ref_height = reference_bounds
+    x, y, width, height = bounds
+    overlap_width = max(min(ref_x + ref_width, x + width) - max(ref_x, x), 0)
+    overlap_height = max(min(ref_y + ref_height, y + height) - max(ref_y, y), 0)
+    overlap = overlap_width * overlap_height
+    union = ref_width * ref_height + width * height - overlap
+    return overlap / union if union > 0 else 0.0
+
+def compare(reference, result):
+    '''Accuracy record of mode result against reference result. Not comparable (zoom_agrees None) when reference path failed.'''
+    if 'error' in reference:
+        return {'iou': None, 'size_error_mm': None, 'zoom_agrees': None, 'reference_error': reference['error']}
+    if 'error' in result:
+        return {'iou': 0.0, 'size_error_mm': None, 'zoom_agrees': False, 'error': result['error']}
+    return {
+        'iou': iou(reference['object_bounds'], result['object_bounds']),
+        'size_error_mm': max(abs(result['object_width_mm'] - reference['object_width_mm']), abs(result['object_height_mm'] - reference['object_height_mm'])),
+        'zoom_agrees': result['zoom_index'] == reference['zoom_index'],
+    }
+
+def summarize(records, mode):
+    '''Summary of mode over corpus records: accuracy and total/per-stage speedup (sums of best wall times).
+    Photos which reference path failed on are only counted as not comparable.'''
+    compared = [record for record in records if 'error' not in record['reference'] and record['reference'].get('zoom_index') is not None]
+    accuracy = [record['modes'][mode] for record in compared]
+    size_errors = [entry['size_error_mm'] for entry in accuracy if entry['size_error_mm'] is not None]
+
+    reference_total = sum(record['reference_s'] for record in compared)
+    mode_total = sum(record['modes'][mode]['wall_s'] or 0.0 for record in compared)
+
+    stage_names = sorted(set(itertools.chain.from_iterable(itertools.chain(record['reference_stages'], record['modes'][mode]['stages'] or {}) for record in compared)))
+    stages = {}
+    for name in stage_names:
+        reference_time = sum(record['reference_stages'].get(name, 0.0) for record in compared)
+        mode_time = sum((record['modes'][mode]['stages'] or {}).get(name, 0.0) for record in compared)
+        stages[name] = {'reference_s': reference_time, 'mode_s': mode_time, 'speedup': reference_time / mode_time if mode_time > 0 else None}
+
+    return {
+        'mode': mode,
+        'photos': len(compared),
+        'min_iou': min((entry['iou'] for entry in accuracy), default=None),
+        'mean_iou': sum(entry['iou'] for entry in accuracy) / len(accuracy) if accuracy else None,
+        'max_size_error_mm': max(size_errors, default=None),
+        'zoom_agreement': sum(entry['zoom_agrees'] for entry in accuracy) / len(accuracy) if accuracy else None,
+        'errors': sum('error' in entry for entry in accuracy),
+        'not_comparable': sum('error' in record['reference'] for record in records),
+        'speedup': reference_total / mode_total if mode_total > 0 else None,
+        'stages': stages,
+    }
+
+def stage_text(name, stage):
+    '''Stage speedup, or total time of stage which runs only in reference path or only in mode.'''
+    if stage['speedup'] is not None and stage['reference_s'] > 0:
+        return '{} x{:.2f}'.format(name, stage['speedup'])
+    if stage['mode_s'] > 0:
+        return '{} +{:.1f} ms'.format(name, 1000 * stage['mode_s'])
+    return '{} -{:.1f} ms'.format(name, 1000 * stage['reference_s'])
+
+def check(summary, min_iou, max_size_error_mm, min_agreement):
+    '''List of failed thresholds of mode summary.'''
+    failures = []
+    if not summary['photos']:
+        failures.append('no comparable photos')
+    if summary['errors']:
+        failures.append('{} photos failed'.format(summary['errors']))
+    if summary['min_iou'] is not None and summary['min_iou'] < min_iou:
+        failures.append('IoU {:.4f} < {}'.format(summary['min_iou'], min_iou))
+    if summary['max_size_error_mm'] is not None and summary['max_size_error_mm'] > max_size_error_mm:
+        failures.append('size error {:.2f} mm > {}'.format(summary['max_size_error_mm'], max_size_error_mm))
+    if summary['zoom_agreement'] is not None and summary['zoom_agreement'] < min_agreement:
+        failures.append('zoom agreement {:.3f} < {}'.format(summary['zoom_agreement'], min_agreement))
+    return failures
+
+def positive_int(value):
+    '''Argparse type of run count: integer of at least 1.'''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, got {}'.format(value))
+    return number
+
+def main():
+    '''Accuracy benchmark entry point'''
+    parser = argparse.ArgumentParser(description='Accuracy against speed of alternative processing modes')
+    parser.add_argument('--modes', type=str, default='pyramid,tiled,components,in_place,roi,two_tier', help='Comma separated modes from {} (default: pyramid,tiled,components,in_place,roi,two_tier)'.format(sorted(MODES)))
+    parser.add_argument('--manifest', type=str, default=None, help='Rig manifest (CSV/JSONL with sn, blue, gray, obj) of recorded photos instead of synthetic scenes')
+    parser.add_argument('--resolutions', type=str, default='2,12', help='Comma separated megapixels of synthetic scenes from {} (default: 2,12)'.format(sorted(RESOLUTIONS)))
+    parser.add_argument('--tilts', type=str, default='90,45', help='Comma separated camera angles, deg (default: 90,45)')
+    parser.add_argument('--object-sizes', type=str, default='0.15,0.3,0.5', help='Comma separated object sizes as part of disc diameter (default: 0.15,0.3,0.5)')
+    parser.add_argument('--offsets', type=str, default='0,0.05', help='Comma separated object offsets from frame center as part of frame size (default: 0,0.05)')
+    parser.add_argument('--noise', type=str, default='2', help='Comma separated sensor noise amplitudes (default: 2)')
+    parser.add_argument('--repeat', type=positive_int, default=1, help='Runs per photo and mode, best is kept (default: 1)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file for per-photo records and summaries (default: not written)')
+    parser.add_argument('--gate', action='store_true', help='Exit with code 1 if any mode fails thresholds')
+    parser.add_argument('--min-iou', type=float, default=0.9, help='Minimal bounding box IoU against reference (default: 0.9)')
+    parser.add_argument('--max-size-error', type=float, default=5.0, help='Maximal object size error against reference, mm (default: 5.0)')
+    parser.add_argument('--min-agreement', type=float, default=1.0, help='Minimal part of photos with reference zoom index (default: 1.0)')
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            print('Unknown mode: ' + mode)
+            sys.exit()
+
+    registry = ProfileRegistry(os.path.join(REPO_DIR, 'settings.json'))
+    if args.manifest is not None:
+        corpus = recorded_corpus(registry, args.manifest)
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus = list(synthetic_corpus(registry, [int(value) for value in args.resolutions.split(',')], [float(value) for value in args.tilts.split(',')],
+                                           [float(value) for value in args.object_sizes.split(',')], [float(value) for value in args.offsets.split(',')],
+                                           [int(value) for value in args.noise.split(',')]))
+
+    # In-memory stage recording, nothing is written by metrics itself
+    metrics.enable()
+
+    records = []
+    for name, calculator, calibration, object_photo in corpus:
+        reference, reference_s, reference_stages = measure(lambda: reference_path(calculator, calibration, object_photo), args.repeat)
+        record = {'photo': name, 'reference': reference, 'reference_s': reference_s, 'reference_stages': reference_stages or {}, 'modes': {}}
+
+        for mode in modes:
+            # Batch processor keeps buffer arena of in-place and tiled modes between repeats
+            processor = BatchProcessor(calculator, calibration, options=ProcessingOptions(**MODES[mode]))
+            result, wall, stages = measure(lambda: processor.process_image(object_photo, name, calculator.serial_number), args.repeat)
+            record['modes'][mode] = dict(compare(reference, result), wall_s=wall, stages=stages, zoom_index=result.get('zoom_index'))
+
+        records.append(record)
+        print('{:<45} zoom {:>2} '.format(name, str(reference.get('zoom_index', reference.get('error')))) +
+              ' '.join('{} {}{}'.format(mode, record['modes'][mode]['zoom_index'], {True: '', False: '!', None: '?'}[record['modes'][mode]['zoom_agrees']]) for mode in modes))
+
+    metrics.disable()
+
+    failed = False
+    summaries = []
+    print()
+    not_comparable = sum('error' in record['reference'] for record in records)
+    if not_comparable:
+        print('{} photos are not comparable: reference path failed'.format(not_comparable))
+    print('{:<18} {:>6} {:>8} {:>8} {:>12} {:>8} {:>8}'.format('mode', 'photos', 'min IoU', 'mean IoU', 'size err mm', 'zoom', 'speedup'))
+    for mode in modes:
+        summary = summarize(records, mode)
+        summary['failures'] = check(summary, args.min_iou, args.max_size_error, args.min_agreement)
+        summaries.append(summary)
+        failed = failed or bool(summary['failures'])
+
+        print('{:<18} {:>6} {:>8} {:>8} {:>12} {:>8} {:>8}  {}'.format(
+            mode, summary['photos'],
+            '{:.4f}'.format(summary['min_iou']) if summary['min_iou'] is not None else '-',
+            '{:.4f}'.format(summary['mean_iou']) if summary['mean_iou'] is not None else '-',
+            '{:.2f}'.format(summary['max_size_error_mm']) if summary['max_size_error_mm'] is not None else '-',
+            '{:.1%}'.format(summary['zoom_agreement']) if summary['zoom_agreement'] is not None else '-',
+            'x{:.2f}'.format(summary['speedup']) if summary['speedup'] is not None else '-',
+            'FAIL: ' + '; '.join(summary['failures']) if summary['failures'] else 'ok'))
+        print('    ' + '  '.join(stage_text(name, stage) for name, stage in summary['stages'].items()))
+
+    if args.output is not None:
+        report = {
+            'meta': {
+                'python': platform.python_version(), 'opencv': cv2.__version__, 'numpy': np.__version__,
+                'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'repeat': args.repeat,
+                'thresholds': {'min_iou': args.min_iou, 'max_size_error_mm': args.max_size_error, 'min_agreement': args.min_agreement},
+            },
+            'summaries': summaries,
+            'records': records,
+        }
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.gate and failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''Compare object bounds engines (contours loop vs connected components) on noisy binarized masks.'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bounds import BoundFinder
+
+def noisy_mask(width, height, noise_density, seed=0):
+    '''Binarized mask with few object blobs and lots of small noise specks (deterministic for seed).'''
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+
+    # Object parts
+    cv2.rectangle(mask, (width // 3, height // 3), (2 * width // 3, 2 * height // 3), 255, -1)
+    cv2.circle(mask, (width // 3, 2 * height // 3), min(width, height) // 10, 255, -1)
+
+    # Noise specks of 1-3 px, each one is separate small contour
+    count = int(width * height * noise_density)
+    xs = rng.integers(0, width, count)
+    ys = rng.integers(0, height, count)
+    sizes = rng.integers(1, 4, count)
+    for x, y, size in zip(xs, ys, sizes):
+        mask[y:y + size, x:x + size] = 255
+
+    return mask
+
+def time_engine(mask, engine, repeat):
+    '''Return (best time per call in seconds, bounds).'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bounds = BoundFinder(None, None).find_object_bounds(mask, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best, bounds
+
+def main():
+    '''Benchmark entry point'''
+    parser = argparse.ArgumentParser(description='Object bounds engines benchmark')
+    parser.add_argument('--width', type=int, default=4000, help='Mask width (default: 4000)')
+    parser.add_argument('--height', type=int, default=3000, help='Mask height (default: 3000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeats per case, best time is reported (default: 3)')
+    parser.add_argument('--output', type=str, default=None, help='JSON file for results (default: print only)')
+    args = parser.parse_args()
+
+    results = []
+    for noise_density in (0.0, 0.0005, 0.002, 0.005, 0.01):
+        mask = noisy_mask(args.width, args.height, noise_density)
+        contours_count = len(cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[0])
+
+        contours_time, contours_bounds = time_engine(mask, 'contours', args.repeat)
+        components_time, components_bounds = time_engine(mask, 'components', args.repeat)
+
+        result = {
+            'noise_density': noise_density,
+            'contours': contours_count,
+            'contours_engine_s': contours_time,
+            'components_engine_s': components_time,
+            'speedup': contours_time / components_time,
+            'same_bounds': contours_bounds == components_bounds,
+        }
+        results.append(result)
+        print('noise {:.4f}: {:6d} contours, contours {:.4f} s, components {:.4f} s, x{:.1f}, same bounds: {}'.format(
+            noise_density, contours_count, contours_time, components_time, result['speedup'], result['same_bounds']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({'width': args.width, 'height': args.height, 'results': results}, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
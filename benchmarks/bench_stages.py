@@ -0,0 +1,171 @@
+'''Per-stage benchmark on synthetic scenes: time, throughput and peak memory of every pipeline stage.
+
+Results are written as JSON, --baseline compares them with results of previous version.
+'''
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from settings_read import SettingsInit
+from zoom import Calculator
+from bounds import BoundFinder
+from scene import RESOLUTIONS, make_scene
+
+def measure(function, repeat):
+    '''Run function repeat times. Return (result, best wall time, mean wall time, mean CPU time, peak traced memory in MB).
+    Peak memory is measured on separate run with tracemalloc (numpy arrays, including OpenCV outputs).'''
+    wall_times = []
+    cpu_times = []
+
+    # Silence prints of calculator and bound finder
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            result = function()
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return result, min(wall_times), sum(wall_times) / repeat, sum(cpu_times) / repeat, peak / 2**20
+
+def make_calculator(calibration_shape):
+    '''Calculator with repo settings and orientation selected for calibration photo shape.'''
+    s = SettingsInit(os.path.join(REPO_DIR, 'settings.json'))
+    calculator = Calculator(s.sensor_wight_mm, s.sensor_height_mm, s.sensor_wight_px, s.sensor_height_px, s.disc_diameter_m, s.possible_focal_length)
+    calculator.calibration_shape = calibration_shape
+    calculator.serial_number = 'bench'
+    calculator.select_camera_orientation()
+    return calculator
+
+def bench_scene(megapixels, tilt_deg, object_size, object_offset, noise, repeat):
+    '''Benchmark all stages on one synthetic scene, return list of stage records.'''
+    width, height = RESOLUTIONS[megapixels]
+    calibration_photo, background_photo, object_photo = make_scene(width, height, tilt_deg, object_size, (object_offset, object_offset), noise)
+
+    calculator = make_calculator(calibration_photo.shape)
+    calibration_bounds = BoundFinder(background_photo, calibration_photo)
+    object_bounds = BoundFinder(background_photo, object_photo)
+
+    stages = []
+
+    def record(stage, function, pixels=width * height):
+        result, best, mean, cpu, peak = measure(function, repeat)
+        stages.append({
+            'megapixels': megapixels, 'width': width, 'height': height, 'tilt_deg': tilt_deg, 'object_size': object_size,
+            'object_offset': object_offset, 'noise': noise,
+            'stage': stage, 'best_s': best, 'mean_s': mean, 'cpu_s': cpu,
+            'mpx_per_s': pixels / 1e6 / best if best > 0 else None, 'calls_per_s': 1 / best if best > 0 else None,
+            'peak_traced_mb': peak,
+        })
+        return result
+
+    blue_mask = record('blue_color_masking', calibration_bounds.blue_color_masking)
+    _, _, disc_width, disc_height = calibration_bounds.find_object_bounds(blue_mask)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        camera_distance_mm = calculator.calculate_camera_distance(disc_width, disc_height)
+        camera_angle_deg = calculator.calculate_camera_angle(disc_width, disc_height)
+
+    disc_mask = record('fill_outside_disc', lambda: calibration_bounds.fill_outside_disc(camera_angle_deg))
+    processed_photo = record('prepare_image', lambda: object_bounds.prepare_image(9, 100))
+    processed_photo = cv2.bitwise_and(processed_photo, disc_mask)
+    bounds = record('find_object_bounds', lambda: object_bounds.find_object_bounds(processed_photo))
+    virtual_bounds = record('find_virtual_bounds', lambda: object_bounds.find_virtual_bounds(*bounds), pixels=0)
+
+    def calculator_math():
+        _, _, big_width, big_height = virtual_bounds
+        calculator.calculate_camera_distance(disc_width, disc_height)
+        calculator.calculate_camera_angle(disc_width, disc_height)
+        object_width_mm, object_height_mm = calculator.calculate_object_size(big_width, big_height, camera_distance_mm)
+        return calculator.calc_zoom(big_width, big_height, object_width_mm, object_height_mm, camera_distance_mm, write_file=False)
+
+    record('calculator', calculator_math, pixels=0)
+
+    return stages
+
+def compare(results, baseline, tolerance, min_time):
+    '''Print stage time ratios against baseline results. Return number of regressions (slower than tolerance).
+    Stages faster than min_time seconds in both runs are too noisy to be reported as regressions.'''
+    def key(record):
+        return (record['megapixels'], record['tilt_deg'], record['object_size'], record['object_offset'], record['noise'], record['stage'])
+
+    baseline_records = {key(record): record for record in baseline['results']}
+    regressions = 0
+
+    for record in results:
+        base = baseline_records.get(key(record))
+        if base is None or not base['best_s']:
+            continue
+        ratio = record['best_s'] / base['best_s']
+        regression = ratio > tolerance and max(record['best_s'], base['best_s']) >= min_time
+        status = 'REGRESSION' if regression else 'ok'
+        regressions += regression
+        print('{:>2} MP tilt {:>4} {:<20} {:8.4f} s vs {:8.4f} s  x{:.2f} {}'.format(
+            record['megapixels'], record['tilt_deg'], record['stage'], record['best_s'], base['best_s'], ratio, status))
+
+    return regressions
+
+def main():
+    '''Benchmark entry point'''
+    parser = argparse.ArgumentParser(description='Per-stage synthetic benchmark')
+    parser.add_argument('--resolutions', type=str, default='2,6,12,24', help='Comma separated megapixels from {} (default: 2,6,12,24)'.format(sorted(RESOLUTIONS)))
+    parser.add_argument('--tilts', type=str, default='90,45', help='Comma separated camera angles, deg (default: 90,45)')
+    parser.add_argument('--object-sizes', type=str, default='0.3', help='Comma separated object sizes as part of disc diameter (default: 0.3)')
+    parser.add_argument('--offsets', type=str, default='0', help='Comma separated object offsets from frame center as part of frame size (default: 0)')
+    parser.add_argument('--noise', type=str, default='2', help='Comma separated sensor noise amplitudes (default: 2)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage (default: 3)')
+    parser.add_argument('--output', type=str, default='bench_stages.json', help='JSON file for results (default: bench_stages.json)')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON results of previous version to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='Allowed slowdown ratio against baseline (default: 1.2)')
+    parser.add_argument('--min-time', type=float, default=0.001, help='Ignore regressions of stages faster than this, s (default: 0.001)')
+    args = parser.parse_args()
+
+    scenes = itertools.product([int(value) for value in args.resolutions.split(',')], [float(value) for value in args.tilts.split(',')],
+                               [float(value) for value in args.object_sizes.split(',')], [float(value) for value in args.offsets.split(',')],
+                               [int(value) for value in args.noise.split(',')])
+
+    results = []
+    for megapixels, tilt_deg, object_size, object_offset, noise in scenes:
+        for record in bench_scene(megapixels, tilt_deg, object_size, object_offset, noise, args.repeat):
+            results.append(record)
+            print('{:>2} MP tilt {:>4} {:<20} best {:8.4f} s  cpu {:8.4f} s  peak {:8.1f} MB'.format(
+                megapixels, tilt_deg, record['stage'], record['best_s'], record['cpu_s'], record['peak_traced_mb']))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(), 'opencv': cv2.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'opencv_threads': cv2.getNumThreads(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_time)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''Deterministic synthetic scenes: gray work disc background, blue calibration disc and object photo.'''
+
+import math
+
+import cv2
+import numpy as np
+
+# Benchmark resolutions, megapixels: (width, height)
+RESOLUTIONS = {
+    2: (1600, 1200),
+    6: (2816, 2112),
+    12: (4000, 3000),
+    20: (5472, 3648),
+    24: (6000, 4000),
+}
+
+def make_scene(width, height, tilt_deg=90.0, object_size=0.3, object_offset=(0.0, 0.0), noise=2, seed=0):
+    '''Return (calibration, background, object) BGR photos of synthetic rig.
+    tilt_deg: camera angle, blue disc is drawn as ellipse with minor/major axis = sin(tilt).
+    object_size: object width as part of work disc diameter (height is 0.7 of width).
+    object_offset: object center offset from frame center as part of frame width/height.
+    noise: amplitude of uniform sensor noise, different for every photo.'''
+    rng = np.random.default_rng(seed)
+    center = (width // 2, height // 2)
+    disc_radius = int(0.45 * min(width, height))
+
+    # Dark rig with gray work disc, blurred edge like on real photo
+    background = np.full((height, width, 3), 40, np.uint8)
+    cv2.circle(background, center, disc_radius, (170, 170, 170), -1)
+    blur = 2 * (min(width, height) // 300) + 1
+    background = cv2.GaussianBlur(background, (blur, blur), 0)
+
+    # Blue calibration disc (half of work disc) seen at tilt angle
+    calibration = background.copy()
+    blue_radius = disc_radius // 2
+    minor_axis = max(int(blue_radius * math.sin(math.radians(tilt_deg))), 1)
+    cv2.ellipse(calibration, center, (blue_radius, minor_axis), 0, 0, 360, (200, 60, 20), -1)
+
+    # Object: orange box with darker label
+    obj = background.copy()
+    object_width = int(object_size * 2 * disc_radius)
+    object_height = int(0.7 * object_width)
+    object_x = int(center[0] + object_offset[0] * width - object_width / 2)
+    object_y = int(center[1] + object_offset[1] * height - object_height / 2)
+    cv2.rectangle(obj, (object_x, object_y), (object_x + object_width, object_y + object_height), (30, 120, 220), -1)
+    cv2.rectangle(obj, (object_x + object_width // 4, object_y + object_height // 4),
+                  (object_x + 3 * object_width // 4, object_y + 3 * object_height // 4), (20, 60, 110), -1)
+
+    photos = []
+    for photo in (calibration, background, obj):
+        if noise:
+            photo = cv2.add(photo, rng.integers(0, noise + 1, photo.shape, dtype=np.uint8))
+        photos.append(photo)
+
+    return tuple(photos)
+
+def object_box(width, height, object_size=0.3, object_offset=(0.0, 0.0)):
+    '''Ground truth (x, y, width, height) of object drawn by make_scene.'''
+    disc_radius = int(0.45 * min(width, height))
+    object_width = int(object_size * 2 * disc_radius)
+    object_height = int(0.7 * object_width)
+    object_x = int(width // 2 + object_offset[0] * width - object_width / 2)
+    object_y = int(height // 2 + object_offset[1] * height - object_height / 2)
+    return (object_x, object_y, object_width + 1, object_height + 1)
+
+def write_scene(directory, name, photos):
+    '''Write scene photos as JPEG files, return (calibration, background, object) paths.'''
+    paths = []
+    for suffix, photo in zip(('blue', 'gray', 'obj'), photos):
+        path = '{}/{}_{}.jpg'.format(directory, name, suffix)
+        cv2.imwrite(path, photo)
+        paths.append(path)
+    return tuple(paths)
+
+if __name__ == '__main__':
+    pass
@@ -6,21 +6,37 @@ import sys
 import cv2
 import numpy as np
 
+from arena import BufferArena
+import metrics
+
 class BoundFinder:
     '''Bound detector and image preparation class.'''
+    # Work disc is detected only on photos taken from top (camera angle, deg), mask radius is smaller than disc by margin (px)
+    DISC_MIN_ANGLE = 60.0
+    DISC_MARGIN = 120
+
     def __init__(self, background_photo, object_photo):
         self.background_photo = background_photo
         self.object_photo = object_photo
 
-    def prepare_image(self, filter_size, filter_sigma):
+    @metrics.timed('segmentation')
+    def prepare_image(self, filter_size, filter_sigma, arena=None):
         '''Get background and object photo and convert them into
-        binarized object mask for bound detection.'''
+        binarized object mask for bound detection. With buffer arena, in-place path is used
+        and returned mask is arena buffer (valid until next call with the same arena).'''
+        if arena is not None:
+            return self.binarize_into(self.object_photo, self.background_photo, filter_size, filter_sigma, arena)
+        return self.binarize(self.object_photo, self.background_photo, filter_size, filter_sigma)
+
+    @staticmethod
+    def binarize(object_photo, background_photo, filter_size, filter_sigma):
+        '''Convert object and background photo (or their same crops) into binarized object mask.'''
 
         kernel = np.ones((5, 5), np.uint8)
         threshold = 10
 
         # Convert background photo copy and object photo copy to HSV, find the difference
-        substracted_image = cv2.absdiff(self.object_photo.copy(), self.background_photo.copy())
+        substracted_image = cv2.absdiff(object_photo.copy(), background_photo.copy())
         substracted_image = cv2.cvtColor(substracted_image, cv2.COLOR_BGR2GRAY)
 
         # Erode/dilate to remove noise, apply bilateral filter/blur to image to remove noise
@@ -32,8 +48,8 @@ class BoundFinder:
         imask =  filtered_image > threshold
 
         #Create black canvas and white background
-        canvas = np.zeros_like(self.object_photo.copy(), np.uint8)
-        whiteboard = np.zeros_like(self.object_photo.copy(), np.uint8)
+        canvas = np.zeros_like(object_photo.copy(), np.uint8)
+        whiteboard = np.zeros_like(object_photo.copy(), np.uint8)
         whiteboard.fill(255)
 
         #Fill canvas with white by  image masl
@@ -52,18 +68,53 @@ class BoundFinder:
 
         return canvas
 
+    @staticmethod
+    def binarize_into(object_photo, background_photo, filter_size, filter_sigma, arena):
+        '''Same mask as binarize(), computed in reusable arena buffers with single channel images only.
+        Painting BGR canvas white, equalizing histogram and Otsu binarization of 0/255 image keep it unchanged,
+        so mask is thresholded filtered difference directly.'''
+
+        kernel = np.ones((5, 5), np.uint8)
+        threshold = 10
+        shape = object_photo.shape[:2]
+
+        # Difference of photos and its grayscale version
+        difference = arena.get('difference', object_photo.shape)
+        cv2.absdiff(object_photo, background_photo, dst=difference)
+        gray = arena.get('gray', shape)
+        cv2.cvtColor(difference, cv2.COLOR_BGR2GRAY, dst=gray)
+
+        # Erode/dilate to remove noise, apply bilateral filter/blur to image to remove noise (bilateral filter can't work in place)
+        opened = arena.get('opened', shape)
+        cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel, dst=opened)
+        cv2.bilateralFilter(opened, filter_size, filter_sigma, filter_sigma, dst=gray)
+        cv2.GaussianBlur(gray, (3, 3), 0, dst=opened)
+
+        #If intensity of a pixel is bigger than threshgold, use this pixel as a mask
+        mask = arena.get('mask', shape)
+        cv2.threshold(opened, threshold, 255, cv2.THRESH_BINARY, dst=mask)
+
+        return mask
+
 
-    def find_object_bounds(self, processed_photo):
-        '''Get processed thresholded photo and find object bounding box.'''
+    @metrics.timed('contour_bounds')
+    def find_object_bounds(self, processed_photo, min_area=1000, engine='contours'):
+        '''Get processed thresholded photo and find object bounding box. Contours smaller than min_area px are ignored.
+        engine: "contours" (reference) or "components" (see find_object_bounds_components).'''
+        if engine == 'components':
+            return self.find_object_bounds_components(processed_photo, min_area)
 
         # Find external contours for processed image
 
-        contours, _ = cv2.findContours(processed_photo.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        contours, _ = cv2.findContours(processed_photo, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        # OpenCV 4.5+ returns tuple of contours
+        contours = list(contours)
+        metrics.count('contours', len(contours))
         popup = []
 
-        # Find contours with area bigger than 1000 px
+        # Find contours with area bigger than min_area (1000 px by default)
         for i in range(len(contours)):
-            if cv2.contourArea(contours[i]) < 1000:
+            if cv2.contourArea(contours[i]) < min_area:
                 popup.append(i)
             else:
                 x_lower, y_lower, width, height = cv2.boundingRect(contours[i])
@@ -81,48 +132,373 @@ class BoundFinder:
         # Return lower corner coordinates and width/height for bounding box
         return (x_lower, y_lower, width, height)
 
+    @staticmethod
+    def outer_contour_area(blob_mask):
+        '''Area of outer contour of single 8-connected blob (enclosed holes included), as cv2.contourArea in find_object_bounds.'''
+        contours, _ = cv2.findContours(blob_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        return max(cv2.contourArea(contour) for contour in contours)
+
+    @staticmethod
+    def find_object_bounds_components(processed_photo, min_area=1000):
+        '''Vectorized object bounding box: connected components statistics, area filtering and union of
+        component rectangles in numpy. Components are filtered on outer contour area like in reference engine
+        (hollow and outline objects are kept), which is calculated only for components with big enough rectangle.'''
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(processed_photo, connectivity=8)
+        metrics.count('components', count - 1)
+
+        # Drop background label 0. Outer contour goes through border pixel centers, so its area is at most
+        # (width - 1) * (height - 1): smaller rectangles (noise specks) are dropped without contour
+        stats = stats[1:]
+        candidates = np.flatnonzero((stats[:, cv2.CC_STAT_WIDTH] - 1) * (stats[:, cv2.CC_STAT_HEIGHT] - 1) >= min_area)
+        keep = []
+        for index in candidates:
+            x, y, width, height = stats[index, :4]
+            blob_mask = (labels[y:y + height, x:x + width] == index + 1).astype(np.uint8)
+            if BoundFinder.outer_contour_area(blob_mask) >= min_area:
+                keep.append(index)
+        stats = stats[keep]
+
+        if stats.shape[0] == 0:
+            raise ValueError('No object bigger than {} px is found'.format(min_area))
+
+        # Union of component rectangles
+        x_lower = stats[:, cv2.CC_STAT_LEFT].min()
+        y_lower = stats[:, cv2.CC_STAT_TOP].min()
+        x_upper = (stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]).max()
+        y_upper = (stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]).max()
+
+        return (int(x_lower), int(y_lower), int(x_upper - x_lower), int(y_upper - y_lower))
+
+    @metrics.timed('tiled_bounds')
+    def find_object_bounds_tiled(self, filter_size, filter_sigma, tile_rows=512, mask=None, engine='contours', keep_mask=False, min_area=1000, arena=None):
+        '''Low-memory segmentation in horizontal strips of tile_rows rows. Every strip is binarized with halo rows
+        covering morphology, bilateral and gaussian kernels, so strip masks are equal to rows of full frame mask.
+        engine "components": component statistics are merged across strip seams, no frame size buffers are needed
+        (rectangles of big components cut by seams are binarized again for their outer contour area).
+        engine "contours" (or keep_mask): strips are assembled into single channel mask for reference engine.
+        Optional mask is work disc mask at full resolution. Return (bounds, mask or None).'''
+        height, width = self.object_photo.shape[:2]
+
+        # Opening 5x5 (erode + dilate), bilateral filter and 3x3 gaussian radiuses plus spare rows
+        halo = 4 + filter_size // 2 + 1 + 2
+        # First, middle and last strips have different buffer shapes
+        arena = arena if arena is not None else BufferArena(max_shapes=3)
+
+        full_mask = np.empty((height, width), np.uint8) if keep_mask or engine != 'components' else None
+
+        # Components engine: union-find parents of global labels, per strip statistics, outer contour areas (-1 for
+        # components on strip seams) and seed pixels of components in first and last strip rows, labels of last row of previous strip
+        parents = []
+        strip_stats = []
+        strip_areas = []
+        strip_seeds = []
+        previous_row = None
+
+        def find(label):
+            while parents[label] != label:
+                parents[label] = parents[parents[label]]
+                label = parents[label]
+            return label
+
+        for row_from in range(0, height, tile_rows):
+            row_to = min(row_from + tile_rows, height)
+            crop_from, crop_to = max(row_from - halo, 0), min(row_to + halo, height)
+
+            strip = self.binarize_into(self.object_photo[crop_from:crop_to], self.background_photo[crop_from:crop_to], filter_size, filter_sigma, arena)
+            strip = strip[row_from - crop_from:row_to - crop_from]
+            if mask is not None:
+                cv2.bitwise_and(strip, mask[row_from:row_to], dst=strip)
+
+            if full_mask is not None:
+                full_mask[row_from:row_to] = strip
+            if engine != 'components':
+                continue
+
+            count, labels, stats, _ = cv2.connectedComponentsWithStats(strip, connectivity=8)
+            offset = len(parents)
+            parents.extend(range(offset, offset + count - 1))
+            stats = stats[1:].astype(np.int64)
+
+            # Components inside strip get outer contour area now (only those with big enough rectangle, see find_object_bounds_components)
+            top, bottom = stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]
+            on_seam = ((top == 0) & (row_from > 0)) | ((bottom == row_to - row_from) & (row_to < height))
+            areas = np.where(on_seam, -1.0, 0.0)
+            for index in np.flatnonzero(~on_seam & ((stats[:, cv2.CC_STAT_WIDTH] - 1) * (stats[:, cv2.CC_STAT_HEIGHT] - 1) >= min_area)):
+                x, y, component_width, component_height = stats[index, :4]
+                areas[index] = self.outer_contour_area((labels[y:y + component_height, x:x + component_width] == index + 1).astype(np.uint8))
+            strip_areas.append(areas)
+
+            # Any pixel of component in first or last strip row is its seed (row, column)
+            seeds = np.full((count - 1, 2), -1, np.int64)
+            for row in (0, row_to - row_from - 1):
+                columns = np.flatnonzero(labels[row])
+                seeds[labels[row, columns] - 1] = np.stack((np.full(columns.size, row_from + row), columns), axis=1)
+            strip_seeds.append(seeds)
+
+            stats[:, cv2.CC_STAT_TOP] += row_from
+            strip_stats.append(stats)
+
+            # Join components touching strip seam (8-connectivity: pixel above and its two neighbours)
+            first_row = np.where(labels[0] > 0, labels[0] - 1 + offset, -1)
+            if previous_row is not None:
+                for shift in (-1, 0, 1):
+                    current = first_row[max(-shift, 0):width - max(shift, 0)]
+                    above = previous_row[max(shift, 0):width - max(-shift, 0)]
+                    touching = (current >= 0) & (above >= 0)
+                    for current_label, above_label in np.unique(np.stack((current[touching], above[touching]), axis=1), axis=0):
+                        parents[find(current_label)] = find(above_label)
+            previous_row = np.where(labels[-1] > 0, labels[-1] - 1 + offset, -1)
+
+        if engine != 'components':
+            return self.find_object_bounds(full_mask, min_area), full_mask
+
+        # Merge statistics of joined components: union of rectangles
+        total = len(parents)
+        metrics.count('components', total)
+        stats = np.concatenate(strip_stats) if strip_stats else np.zeros((0, 5), np.int64)
+        areas = np.concatenate(strip_areas) if strip_areas else np.zeros(0)
+        seeds = np.concatenate(strip_seeds) if strip_seeds else np.zeros((0, 2), np.int64)
+        roots = np.array([find(label) for label in range(total)], dtype=np.int64)
+
+        x_lower = np.full(total, width, np.int64)
+        y_lower = np.full(total, height, np.int64)
+        x_upper = np.zeros(total, np.int64)
+        y_upper = np.zeros(total, np.int64)
+        np.minimum.at(x_lower, roots, stats[:, cv2.CC_STAT_LEFT])
+        np.minimum.at(y_lower, roots, stats[:, cv2.CC_STAT_TOP])
+        np.maximum.at(x_upper, roots, stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH])
+        np.maximum.at(y_upper, roots, stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT])
+
+        # Merged components (roots) with big enough rectangle. Components joined at seams are made of seam
+        # components only, so root of component on seam has seed and its outer contour area is calculated here
+        candidates = (roots == np.arange(total)) & ((x_upper - x_lower - 1) * (y_upper - y_lower - 1) >= min_area)
+        for label in np.flatnonzero(candidates & (areas < 0)):
+            areas[label] = self._seam_component_area(x_lower[label], y_lower[label], x_upper[label], y_upper[label], seeds[label],
+                                                     filter_size, filter_sigma, mask, halo, tile_rows)
+
+        # Keep merged components not smaller than min_area
+        keep = candidates & (areas >= min_area)
+        if not keep.any():
+            raise ValueError('No object bigger than {} px is found'.format(min_area))
+
+        x_from, y_from = x_lower[keep].min(), y_lower[keep].min()
+        bounds = (int(x_from), int(y_from), int(x_upper[keep].max() - x_from), int(y_upper[keep].max() - y_from))
+        return bounds, full_mask
+
+    def find_object_bounds_coarse(self, filter_size, filter_sigma, scale=4, mask=None, engine='contours'):
+        '''Object bounds found on photos downscaled by scale, in full resolution coordinates.
+        Optional mask is work disc mask at full resolution. Coarse filters spread the mask, so box edges are usually
+        1-3 coarse px (scale full resolution px each) outside full resolution edges.'''
+        height, width = self.object_photo.shape[:2]
+
+        # Coarse segmentation on downscaled photos
+        small_object = cv2.resize(self.object_photo, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+        small_background = cv2.resize(self.background_photo, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+        coarse_photo = self.binarize(small_object, small_background, filter_size, filter_sigma)
+
+        if mask is not None:
+            small_mask = cv2.resize(mask, (width // scale, height // scale), interpolation=cv2.INTER_NEAREST)
+            coarse_photo = cv2.bitwise_and(coarse_photo, small_mask)
+
+        x_lower, y_lower, box_width, box_height = self.find_object_bounds(coarse_photo, 1000 / scale**2, engine)
+
+        # Coarse box edges at full resolution
+        x_from, y_from = x_lower * scale, y_lower * scale
+        x_to, y_to = min((x_lower + box_width) * scale, width), min((y_lower + box_height) * scale, height)
+        return (x_from, y_from, x_to - x_from, y_to - y_from)
+
+    def _seam_component_area(self, x_from, y_from, x_to, y_to, seed, filter_size, filter_sigma, mask, halo, tile_rows):
+        '''Outer contour area of component cut by strip seams: its rectangle is binarized again in strips (with halo)
+        and component is filled from seed pixel (row, column). Memory is about two bytes per rectangle pixel.'''
+        height, width = self.object_photo.shape[:2]
+        crop_x_from, crop_x_to = max(x_from - halo, 0), min(x_to + halo, width)
+        arena = BufferArena(max_shapes=3)
+
+        region = np.empty((y_to - y_from, x_to - x_from), np.uint8)
+        for row_from in range(y_from, y_to, tile_rows):
+            row_to = min(row_from + tile_rows, y_to)
+            crop_from, crop_to = max(row_from - halo, 0), min(row_to + halo, height)
+            strip = self.binarize_into(self.object_photo[crop_from:crop_to, crop_x_from:crop_x_to], self.background_photo[crop_from:crop_to, crop_x_from:crop_x_to],
+                                       filter_size, filter_sigma, arena)
+            region[row_from - y_from:row_to - y_from] = strip[row_from - crop_from:row_to - crop_from, x_from - crop_x_from:x_to - crop_x_from]
+        if mask is not None:
+            cv2.bitwise_and(region, mask[y_from:y_to, x_from:x_to], dst=region)
+
+        # 8-connected fill of seed component into fill mask only (fill mask has 1 px border, contour area does not depend on offset)
+        blob_mask = np.zeros((region.shape[0] + 2, region.shape[1] + 2), np.uint8)
+        cv2.floodFill(region, blob_mask, (int(seed[1] - x_from), int(seed[0] - y_from)), 0, 0, 0, 8 | cv2.FLOODFILL_MASK_ONLY | (1 << 8))
+        return self.outer_contour_area(blob_mask)
+
+    @metrics.timed('pyramid_bounds')
+    def find_object_bounds_pyramid(self, filter_size, filter_sigma, scale=4, mask=None, band=None, engine='contours', min_area=1000):
+        '''Coarse-to-fine object bounds: segment photos downscaled by scale, then refine every bounding box edge
+        at full resolution inside narrow band around it (see refine_object_bounds). Optional mask is work disc mask at full resolution.'''
+        # Coarse box edges at full resolution. Edge position is known with +-scale px precision
+        coarse_bounds = self.find_object_bounds_coarse(filter_size, filter_sigma, scale, mask, engine)
+        return self.refine_object_bounds(coarse_bounds, filter_size, filter_sigma, scale, mask, band, min_area)
+
+    def refine_object_bounds(self, coarse_bounds, filter_size, filter_sigma, scale=4, mask=None, band=None, min_area=1000):
+        '''Refine every edge of box found by find_object_bounds_coarse with given scale at full resolution inside narrow band around it.
+        Band components with outer contour area below min_area are ignored as in find_object_bounds, unless they are cut by band crop
+        side facing box interior (object continues there, its full size is not known in band).
+        Raise ValueError when no band has object pixels (coarse box was made only of blobs rejected at full resolution).'''
+        height, width = self.object_photo.shape[:2]
+        x_from, y_from, box_width, box_height = coarse_bounds
+        x_to, y_to = x_from + box_width, y_from + box_height
+
+        # Coarse filters spread the mask by about filter_size / 2 coarse px, band must cover this bias
+        band = band if band is not None else scale * (filter_size // 2 + 2)
+        # Halo covers morphology, bilateral and gaussian kernels, so band pixels are binarized as on full photo
+        halo = filter_size + 8
+
+        def band_mask(band_x_from, band_x_to, band_y_from, band_y_to, inner_side):
+            band_x_from, band_y_from = max(band_x_from, 0), max(band_y_from, 0)
+            band_x_to, band_y_to = min(band_x_to, width), min(band_y_to, height)
+            crop_x_from, crop_y_from = max(band_x_from - halo, 0), max(band_y_from - halo, 0)
+            crop_x_to, crop_y_to = min(band_x_to + halo, width), min(band_y_to + halo, height)
+
+            crop_photo = self.binarize(self.object_photo[crop_y_from:crop_y_to, crop_x_from:crop_x_to],
+                                       self.background_photo[crop_y_from:crop_y_to, crop_x_from:crop_x_to], filter_size, filter_sigma)
+            if mask is not None:
+                crop_photo = cv2.bitwise_and(crop_photo, mask[crop_y_from:crop_y_to, crop_x_from:crop_x_to])
+
+            # Drop small noise blobs next to object, keep components cut by crop side facing box interior (part of bigger blob)
+            _, labels, stats, _ = cv2.connectedComponentsWithStats(crop_photo, connectivity=8)
+            crop_height, crop_width = crop_photo.shape[:2]
+            cut = {
+                'left': stats[:, cv2.CC_STAT_LEFT] == 0,
+                'right': stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH] == crop_width,
+                'top': stats[:, cv2.CC_STAT_TOP] == 0,
+                'bottom': stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT] == crop_height,
+            }[inner_side]
+            # Other blobs are kept by outer contour area, calculated only for big enough rectangles (label 0 is background)
+            candidates = ~cut & ((stats[:, cv2.CC_STAT_WIDTH] - 1) * (stats[:, cv2.CC_STAT_HEIGHT] - 1) >= min_area)
+            candidates[0] = False
+            keep = cut.copy()
+            keep[0] = False
+            for index in np.flatnonzero(candidates):
+                x, y, blob_width, blob_height = stats[index, :4]
+                keep[index] = self.outer_contour_area((labels[y:y + blob_height, x:x + blob_width] == index).astype(np.uint8)) >= min_area
+            crop_photo = keep[labels]
+
+            return band_x_from, band_y_from, crop_photo[band_y_from - crop_y_from:band_y_to - crop_y_from, band_x_from - crop_x_from:band_x_to - crop_x_from]
+
+        # Refine left and right edges in vertical bands, top and bottom edges in horizontal bands. Empty band
+        # (coarse box was widened by small blobs dropped here) is moved inwards until object pixels are found
+        refined_x_from, refined_x_to, refined_y_from, refined_y_to = x_from, x_to, y_from, y_to
+        found = 0
+
+        for shift in range(0, max(box_width, 1), 2 * band):
+            left, top, left_band = band_mask(x_from - band + shift, x_from + band + shift, y_from - band, y_to + band, 'right')
+            columns = np.flatnonzero(left_band.any(axis=0))
+            if columns.size:
+                refined_x_from = left + columns[0]
+                found += 1
+                break
+
+        for shift in range(0, max(box_width, 1), 2 * band):
+            left, top, right_band = band_mask(x_to - band - shift, x_to + band - shift, y_from - band, y_to + band, 'left')
+            columns = np.flatnonzero(right_band.any(axis=0))
+            if columns.size:
+                refined_x_to = left + columns[-1] + 1
+                found += 1
+                break
+
+        for shift in range(0, max(box_height, 1), 2 * band):
+            left, top, top_band = band_mask(x_from - band, x_to + band, y_from - band + shift, y_from + band + shift, 'bottom')
+            rows = np.flatnonzero(top_band.any(axis=1))
+            if rows.size:
+                refined_y_from = top + rows[0]
+                found += 1
+                break
+
+        for shift in range(0, max(box_height, 1), 2 * band):
+            left, top, bottom_band = band_mask(x_from - band, x_to + band, y_to - band - shift, y_to + band - shift, 'top')
+            rows = np.flatnonzero(bottom_band.any(axis=1))
+            if rows.size:
+                refined_y_to = top + rows[-1] + 1
+                found += 1
+                break
+
+        if not found:
+            raise ValueError('No object bigger than {} px is found'.format(min_area))
+
+        return (int(refined_x_from), int(refined_y_from), int(refined_x_to - refined_x_from), int(refined_y_to - refined_y_from))
+
+    @staticmethod
+    def bounds_error(reference_bounds, bounds):
+        '''Maximal edge displacement (px) between two (x, y, width, height) bounding boxes.'''
+        ref_x, ref_y, ref_width, ref_height = reference_bounds
+        x, y, width, height = bounds
+        return max(abs(x - ref_x), abs(y - ref_y), abs(x + width - ref_x - ref_width), abs(y + height - ref_y - ref_height))
+
+    @staticmethod
+    def disc_roi(circle, shape, margin):
+        '''Bounding square (x_from, y_from, x_to, y_to) of work disc circle plus margin, clipped to image shape.
+        Return None if there is no circle'''
+        if circle is None:
+            return None
+
+        xc, yc, radius = circle
+        height, width = shape[:2]
+        return (max(xc - radius - margin, 0), max(yc - radius - margin, 0), min(xc + radius + margin, width), min(yc + radius + margin, height))
+
     def fill_outside_disc(self, angle):
         '''This function detect gray disc edge and return mask to fill all outside of work disc with black (to remove noise) if camera angle > 75deg'''
-        if angle > 60.0:
-            # Convert background photo copy to grayscale
-            background_gray = cv2.cvtColor(self.background_photo.copy(), cv2.COLOR_BGR2GRAY)
+        return self.disc_mask(self.object_photo.shape[:2], self.find_disc_circle(angle))
+
+    def find_disc_circle(self, angle, background_gray=None):
+        '''Detect gray work disc on background photo if camera angle > 60deg. Return (x, y, radius) with 120 px margin or None
+        background_gray: already decoded half resolution grayscale background (see decode.ImageDecoder), optional.'''
+        if angle > self.DISC_MIN_ANGLE:
+            circle = self.detect_disc_circle(background_gray)
+            if circle is not None:
+                return (circle[0], circle[1], circle[2] - self.DISC_MARGIN)
+
+        return None
+
+    @metrics.timed('hough_disc')
+    def detect_disc_circle(self, background_gray=None):
+        '''Run HoughCircles on half resolution grayscale background. Return biggest circle (x, y, radius) at full resolution or None'''
+        # Convert background photo to half resolution grayscale
+        if background_gray is None:
+            background_gray = cv2.cvtColor(self.background_photo, cv2.COLOR_BGR2GRAY)
             background_gray = cv2.resize(background_gray, (0, 0), fx=0.5, fy=0.5, interpolation=cv2.INTER_CUBIC)
 
-            # detect circles in the image
-            circles = cv2.HoughCircles(background_gray, cv2.HOUGH_GRADIENT, dp=1.2, minDist=100, minRadius=150)
+        # detect circles in the image
+        circles = cv2.HoughCircles(background_gray, cv2.HOUGH_GRADIENT, dp=1.2, minDist=100, minRadius=150)
+        metrics.count('hough_circles', len(circles[0]) if circles is not None else 0)
 
-            # ensure at least some circles were found
-            if circles is not None:
-                # convert the (x, y) coordinates and radius of the circles to integers and multiply back on 1/scale_coef
-                circles = np.round(circles[0, :]).astype('int')
-                circles = circles * 2
+        # ensure at least some circles were found
+        if circles is None:
+            return None
 
-                #Find circle with biggest radius, apply 120 px margin
-                biggest_circle = circles[np.argmax(circles[:, 2])]
+        # convert the (x, y) coordinates and radius of the circles to integers and multiply back on 1/scale_coef
+        circles = np.round(circles[0, :]).astype('int')
+        circles = circles * 2
 
-                xc, yc, radius = biggest_circle[0], biggest_circle[1], biggest_circle[2]-120
+        #Find circle with biggest radius
+        biggest_circle = circles[np.argmax(circles[:, 2])]
 
-                #Create filtering mask with circle (draw white filled circle on black background as mask)
-                filter_mask = np.zeros_like(self.object_photo)
-                filter_mask = cv2.circle(filter_mask, (xc, yc), radius, (255, 255, 255), -1)
-                filter_mask = cv2.cvtColor(filter_mask, cv2.COLOR_BGR2GRAY)
-            else:
-                #Create array of 255 to let code flow properly
-                filter_mask = np.zeros_like(self.object_photo.copy(), np.uint8)
-                filter_mask.fill(255)
-        else:
-            #Create array of 255 to let code flow properly
-            filter_mask = np.zeros_like(self.object_photo.copy(), np.uint8)
-            filter_mask.fill(255)
-        return filter_mask
+        return (int(biggest_circle[0]), int(biggest_circle[1]), int(biggest_circle[2]))
+
+    @staticmethod
+    def disc_mask(shape, circle):
+        '''Create single channel filtering mask of given (height, width) with white filled disc circle on black background.
+        If circle is None, mask is white to let code flow properly'''
+        if circle is None:
+            return np.full(shape, 255, np.uint8)
+
+        xc, yc, radius = circle
+        filter_mask = np.zeros(shape, np.uint8)
+        return cv2.circle(filter_mask, (xc, yc), radius, 255, -1)
 
+    @metrics.timed('calibration_masking')
     def blue_color_masking(self):
         '''Create mask to ignore all non-blue objects'''
 
-        # Create copy of blue disc image for safe processing and convert to HSV format
-        loaded_image = self.object_photo.copy()
-
-        blue_disc_image = cv2.cvtColor(loaded_image, cv2.COLOR_BGR2HSV)
+        # Convert blue disc image to HSV format (new image, source photo is not modified)
+        blue_disc_image = cv2.cvtColor(self.object_photo, cv2.COLOR_BGR2HSV)
 
         # Apply bilateral filter/blur to image to remove noise
         blue_disc_image = cv2.GaussianBlur(blue_disc_image, (3, 3), 0)
@@ -147,6 +523,30 @@ class BoundFinder:
 
 
 
+    @staticmethod
+    def find_virtual_bounds_batch(shape, bounds):
+        '''Vectorized find_virtual_bounds() (without centering check) for array of (x, y, width, height) boxes
+        on photo of shape. Return integer array of virtual (x, y, width, height) boxes.'''
+        image_center_y, image_center_x = shape[0] / 2, shape[1] / 2
+        bounds = np.asarray(bounds).reshape(-1, 4)
+        x_from, y_from = bounds[:, 0], bounds[:, 1]
+        x_to, y_to = x_from + bounds[:, 2], y_from + bounds[:, 3]
+
+        # Corners in find_virtual_bounds order, first most distant corner wins
+        corners_x = np.stack((x_from, x_to, x_to, x_from), axis=1)
+        corners_y = np.stack((y_from, y_from, y_to, y_to), axis=1)
+        distances = np.sqrt((corners_x - image_center_x)**2 + (corners_y - image_center_y)**2)
+        farthest = np.argmax(distances, axis=1)[:, None]
+        max_point_x = np.take_along_axis(corners_x, farthest, axis=1)[:, 0]
+        max_point_y = np.take_along_axis(corners_y, farthest, axis=1)[:, 0]
+
+        big_bounding_wight = np.trunc(2 * np.abs(max_point_x - image_center_x))
+        big_bounding_height = np.trunc(2 * np.abs(max_point_y - image_center_y))
+        big_bounding_lower_x = np.trunc(image_center_x - big_bounding_wight / 2)
+        big_bounding_lower_y = np.trunc(image_center_y - big_bounding_height / 2)
+
+        return np.stack((big_bounding_lower_x, big_bounding_lower_y, big_bounding_wight, big_bounding_height), axis=1).astype(int)
+
     def find_virtual_bounds(self, small_bounding_lower_x, small_bounding_lower_y, small_bounding_wight, small_bounding_height):
         '''Find big virtual bounding box for biased object. Also perfom a check if object is not centered properly'''
         try:
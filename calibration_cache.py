@@ -0,0 +1,91 @@
+'''On-disk calibration cache: skip blue disc masking, distance/angle and disc detection for known calibration shots.'''
+
+import hashlib
+import json
+import os
+import time
+
+class CalibrationCache:
+    '''Calibration products stored as JSON files keyed by camera serial, image content and settings.
+    Least recently used entries are evicted when cache has more than max_entries, entries older than max_age_s are dropped.'''
+    def __init__(self, cache_dir, max_entries=256, max_age_s=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(serial_number, path_to_calibration_image, path_to_background_image, settings_values):
+        '''Build cache key from camera serial, calibration/background image bytes and settings values.'''
+        key = hashlib.sha256()
+        key.update(str(serial_number).encode())
+        key.update(json.dumps(settings_values, sort_keys=True).encode())
+
+        for path_to_image in (path_to_calibration_image, path_to_background_image):
+            with open(path_to_image, 'rb') as image_file:
+                for chunk in iter(lambda: image_file.read(1 << 20), b''):
+                    key.update(chunk)
+
+        return key.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def load(self, key):
+        '''Return cached record for key or None if record is missing, expired or broken.'''
+        path_to_entry = self._entry_path(key)
+        try:
+            if time.time() - os.path.getmtime(path_to_entry) > self.max_age_s:
+                os.remove(path_to_entry)
+                return None
+
+            with open(path_to_entry) as entry_file:
+                record = json.load(entry_file)
+
+            # Touch entry to keep recently used records on eviction
+            os.utime(path_to_entry)
+
+        except (OSError, ValueError):
+            return None
+
+        return record
+
+    def store(self, key, record):
+        '''Atomically write record for key and evict old entries.'''
+        path_to_entry = self._entry_path(key)
+        temp_path = path_to_entry + '.' + str(os.getpid()) + '.tmp'
+
+        with open(temp_path, 'w') as entry_file:
+            json.dump(record, entry_file)
+        os.replace(temp_path, path_to_entry)
+
+        self.evict()
+
+    def evict(self):
+        '''Remove expired entries and least recently used entries above max_entries.'''
+        now = time.time()
+        entries = []
+
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.json'):
+                continue
+            path_to_entry = os.path.join(self.cache_dir, file_name)
+            try:
+                mtime = os.path.getmtime(path_to_entry)
+                if now - mtime > self.max_age_s:
+                    os.remove(path_to_entry)
+                else:
+                    entries.append((mtime, path_to_entry))
+            except OSError:
+                continue
+
+        entries.sort(reverse=True)
+        for _, path_to_entry in entries[self.max_entries:]:
+            try:
+                os.remove(path_to_entry)
+            except OSError:
+                pass
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,157 @@
+'''Camera profile registry: camera serial number -> compiled sensor/lens profile from settings file, reloaded when file changes.
+
+Settings file keys (besides sensor keys read by settings_read.SettingsInit):
+    "POSSIBLE_FOCAL_<NAME>": focal table of lens NAME, every table gives profile NAME with top level sensor values
+    "PROFILES": {"NAME": {"SENSOR_WIGHT_MM": ..., "POSSIBLE_FOCAL": [...]}}  optional per profile overrides
+    "CAMERAS": {"SERIAL": "NAME"}  profile of every camera serial
+    "DEFAULT_PROFILE": "NAME"  profile of cameras missing in CAMERAS (default: G9)
+'''
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+_PROFILE_FIELDS = ('name', 'sensor_wight_mm', 'sensor_height_mm', 'sensor_wight_px', 'sensor_height_px', 'disc_diameter_m',
+                   'possible_focal_length', 'px_dest_wight', 'px_dest_height', 'focal_order', 'focal_table', 'rotated')
+
+class CameraProfile(collections.namedtuple('CameraProfile', _PROFILE_FIELDS)):
+    '''Immutable sensor/lens profile with derived constants: sensor pixel densities (px/mm, same expressions as
+    zoom.Calculator used), sorted focal table for searchsorted and focal_order mapping sorted position to zoom index - 1.
+    rotated is the same profile with swapped sensor sides (portrait photos), its own rotated is None.'''
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, name, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length):
+        '''Compile profile and its orientation swapped variant.'''
+        rotated = cls._compile(name, sensor_height_mm, sensor_wight_mm, sensor_height_px, sensor_wight_px, disc_diameter_m, possible_focal_length, None)
+        return cls._compile(name, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length, rotated)
+
+    @classmethod
+    def _compile(cls, name, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length, rotated):
+        possible_focal_length = tuple(possible_focal_length)
+        focals = np.asarray(possible_focal_length, dtype=float)
+        focal_order = np.argsort(focals, kind='stable')
+        focal_table = focals[focal_order]
+        # Shared between calculators of all threads
+        focal_order.flags.writeable = False
+        focal_table.flags.writeable = False
+
+        return cls(name, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length,
+                   sensor_wight_px / sensor_wight_mm, sensor_height_px / sensor_height_mm, focal_order, focal_table, rotated)
+
+    def settings_values(self):
+        '''Sensor, disc and focal values as they are in settings file (calibration cache key part).'''
+        return [self.sensor_wight_mm, self.sensor_height_mm, self.sensor_wight_px, self.sensor_height_px, self.disc_diameter_m, list(self.possible_focal_length)]
+
+
+def compile_profiles(json_dict):
+    '''Build (profiles by name, profile name by serial number, default profile name) from settings dictionary.
+    Raise KeyError or ValueError for incomplete or inconsistent settings.'''
+    base = {key: value for key, value in json_dict.items() if key not in ('PROFILES', 'CAMERAS', 'DEFAULT_PROFILE')}
+    sources = {key[len('POSSIBLE_FOCAL_'):]: {'POSSIBLE_FOCAL': value} for key, value in json_dict.items() if key.startswith('POSSIBLE_FOCAL_')}
+    for name, overrides in json_dict.get('PROFILES', {}).items():
+        sources.setdefault(name, {}).update(overrides)
+
+    profiles = {}
+    for name, overrides in sources.items():
+        values = dict(base, **overrides)
+        possible_focal_length = values['POSSIBLE_FOCAL']
+        if isinstance(possible_focal_length, str):
+            # Reference to shared focal table key, e.g. "POSSIBLE_FOCAL_G10"
+            possible_focal_length = json_dict[possible_focal_length]
+        if not possible_focal_length:
+            raise ValueError('Empty focal table of profile ' + name)
+
+        profiles[name] = CameraProfile.build(name, float(values['SENSOR_WIGHT_MM']), float(values['SENSOR_HEIGHT_MM']),
+                                             int(values['SENSOR_WIGHT_PX']), int(values['SENSOR_HEIGHT_PX']),
+                                             float(values['DISC_DIAMETER_M']), [float(focal) for focal in possible_focal_length])
+
+    default_name = json_dict.get('DEFAULT_PROFILE', 'G9')
+    cameras = {str(serial_number): name for serial_number, name in json_dict.get('CAMERAS', {}).items()}
+    for name in set(cameras.values()) | {default_name}:
+        if name not in profiles:
+            raise ValueError('Unknown camera profile ' + str(name))
+
+    return (profiles, cameras, default_name)
+
+
+class ProfileRegistry:
+    '''Compiled camera profiles of settings file. Lookups are dictionary reads of current immutable snapshot;
+    settings file modification time and size are checked at most every check_interval seconds and changed file
+    is compiled into new snapshot. Broken file on reload keeps previous snapshot (broken file on start exits).'''
+    def __init__(self, path_to_settings='settings.json', check_interval=1.0):
+        self.path_to_settings = str(path_to_settings)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.checked = 0.0
+        self.stamp = None
+        self.snapshot = None
+
+        if not self.reload():
+            sys.exit()
+
+    def _stamp(self):
+        try:
+            file_stat = os.stat(self.path_to_settings)
+        except OSError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def reload(self, stamp=None):
+        '''Compile settings file into new snapshot. Return True if snapshot was replaced.'''
+        stamp = stamp or self._stamp()
+        try:
+            with open(self.path_to_settings) as settings_file:
+                snapshot = compile_profiles(json.load(settings_file))
+        except FileNotFoundError:
+            print('Settings file is not found')
+            return False
+        except (KeyError, TypeError, ValueError) as error:
+            print('Settings file is not valid: ' + str(error))
+            return False
+
+        with self.lock:
+            self.snapshot = snapshot
+            self.stamp = stamp
+        metrics.count('profile_reloads')
+        return True
+
+    def refresh(self):
+        '''Reload settings file if it changed since last check.'''
+        now = time.monotonic()
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+
+        stamp = self._stamp()
+        if stamp is not None and stamp != self.stamp:
+            # Failed reload is retried only after next file change
+            if not self.reload(stamp):
+                self.stamp = stamp
+
+    def profile(self, serial_number=None):
+        '''Profile of camera serial number (default profile for unknown serials).'''
+        self.refresh()
+        profiles, cameras, default_name = self.snapshot
+        return profiles[cameras.get(str(serial_number), default_name)]
+
+    def profiles(self):
+        '''Current {name: profile} dictionary.'''
+        self.refresh()
+        return dict(self.snapshot[0])
+
+    def calculator(self, serial_number=None):
+        '''New zoom.Calculator with profile of camera serial number.'''
+        # Imported here: zoom module itself builds profiles for calculators made from plain values
+        from zoom import Calculator
+        return Calculator.from_profile(self.profile(serial_number))
+
+if __name__ == '__main__':
+    pass
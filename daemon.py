@@ -0,0 +1,214 @@
+'''Resident zoom service: settings, calibration and background image stay in memory between requests.
+
+Protocol is one JSON object per line in both directions over Unix socket or localhost TCP:
+    {"cmd": "calibrate", "sn": "SERIAL", "blue": "blue.jpg", "gray": "gray.jpg"}
+    {"cmd": "zoom", "sn": "SERIAL", "obj": "object.jpg"}
+    {"cmd": "zoom", "sn": "SERIAL", "image": "<base64 encoded JPEG/PNG bytes>"}
+    {"cmd": "ping"}
+Zoom response contains object and virtual bounding boxes, object size (mm) and zoom index.
+'''
+
+import argparse
+import base64
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from camera_profiles import ProfileRegistry
+from pipeline import add_processing_arguments, calibrate, BatchProcessor, ProcessingOptions, CALCULATION_ERRORS
+from decode import ImageDecoder
+from disc_tracker import DiscTracker, state_path
+from calibration_cache import CalibrationCache
+import metrics
+
+class ZoomService:
+    '''In-memory zoom calculator: one calibrated processor per camera serial number.'''
+    def __init__(self, cache_dir=None, write_zoom=False, options=None, reduced_decode=False, track_disc=False):
+        # Camera profiles per serial number, settings file changes are picked up by next calibration
+        self.registry = ProfileRegistry()
+        self.cache = CalibrationCache(cache_dir) if cache_dir is not None else None
+        self.write_zoom = write_zoom
+        self.options = options
+
+        # Shared decoded photo cache: recalibration with the same files does not decode them again
+        self.decoder = ImageDecoder() if reduced_decode else None
+        # Work disc circles per camera serial, recalibration runs HoughCircles only when disc moved
+        self.tracker = DiscTracker(state_path(cache_dir) if cache_dir is not None else None) if track_disc else None
+
+        self.processors = {}
+        self.lock = threading.Lock()
+
+    def calibrate(self, serial_number, path_to_calibration_image, path_to_background_image):
+        '''Calibrate camera and keep calibration products and background image in memory.'''
+        calculator = self.registry.calculator(serial_number)
+        calculator.decoder = self.decoder
+        calculator.load_images(path_to_calibration_image, path_to_background_image, serial_number=serial_number, read_calibration=self.cache is None)
+
+        if calculator.background_image is None:
+            raise ValueError('File is not found')
+
+        calibration = calibrate(calculator, self.cache, self.tracker)
+
+        # Replace processor at once, requests in flight keep using old calibration
+        with self.lock:
+            self.processors[str(serial_number)] = BatchProcessor(calculator, calibration, options=self.options)
+
+        return {
+            'sn': str(serial_number),
+            'camera_distance_mm': calibration.camera_distance_mm,
+            'camera_angle_deg': calibration.camera_angle_deg,
+            'disc_circle': calibration.disc_circle,
+        }
+
+    def zoom(self, serial_number, path_to_object_image=None, encoded_image=None):
+        '''Calculate zoom for object photo given by path or encoded image bytes.'''
+        with self.lock:
+            processor = self.processors.get(str(serial_number))
+
+        if processor is None:
+            raise ValueError('Camera is not calibrated: ' + str(serial_number))
+
+        if encoded_image is not None:
+            object_image = cv2.imdecode(np.frombuffer(encoded_image, np.uint8), cv2.IMREAD_COLOR)
+            path_to_object_image = path_to_object_image or '<bytes>'
+        else:
+            object_image = cv2.imread(path_to_object_image)
+
+        if object_image is None:
+            raise ValueError('File is not found')
+
+        result = processor.process_image(object_image, path_to_object_image, str(serial_number))
+
+        if self.write_zoom and 'zoom_index' in result:
+            processor.calculator.write_zoom(result['zoom_index'], str(serial_number))
+
+        return result
+
+    def handle(self, request):
+        '''Dispatch one decoded request, return response dictionary.'''
+        command = request.get('cmd')
+        try:
+            if command == 'zoom':
+                encoded_image = base64.b64decode(request['image']) if 'image' in request else None
+                return self.zoom(request.get('sn', 'None'), request.get('obj'), encoded_image)
+            if command == 'calibrate':
+                return self.calibrate(request.get('sn', 'None'), request['blue'], request['gray'])
+            if command == 'ping':
+                return {'ok': True}
+            return {'error': 'Unknown command: ' + str(command)}
+
+        except (KeyError,) + CALCULATION_ERRORS as error:
+            return {'error': str(error) or 'Calculation error'}
+
+
+class ZoomRequestHandler(socketserver.StreamRequestHandler):
+    '''Read JSON requests line by line, connection can be kept open for many requests.'''
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+
+            # Valid JSON which is not an object (list, number, string) is bad request too
+            if not isinstance(request, dict):
+                response = {'error': 'Bad request'}
+            else:
+                response = self.server.service.handle(request)
+                metrics.flush({'mode': 'service', 'cmd': request.get('cmd'), 'sn': request.get('sn')})
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class UnixZoomServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''Threaded Unix socket server.'''
+    daemon_threads = True
+
+
+class TCPZoomServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    '''Threaded localhost TCP server.'''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # Disable Nagle: responses are small and latency matters
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().server_bind()
+
+
+class ZoomClient:
+    '''Minimal client for zoom service keeping one connection open.'''
+    def __init__(self, socket_path=None, port=None):
+        if socket_path is not None:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(socket_path)
+        else:
+            self.connection = socket.create_connection(('127.0.0.1', port))
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.connection.makefile('rwb')
+
+    def request(self, **request):
+        '''Send request and wait for response.'''
+        self.stream.write(json.dumps(request).encode() + b'\n')
+        self.stream.flush()
+        return json.loads(self.stream.readline())
+
+    def close(self):
+        '''Close connection.'''
+        self.stream.close()
+        self.connection.close()
+
+
+def main():
+    '''Zoom service entry point'''
+    parser = argparse.ArgumentParser(description='Resident zoom service')
+    parser.add_argument('--socket', type=str, default='/tmp/autozoom.sock', help='Unix socket path (default: /tmp/autozoom.sock)')
+    parser.add_argument('--port', type=int, default=None, help='Listen on localhost TCP port instead of Unix socket')
+    parser.add_argument('--blue', type=str, default=None, help='Blue disc photo name to calibrate on start')
+    parser.add_argument('--gray', type=str, default=None, help='Gray disc photo name to calibrate on start')
+    parser.add_argument('--sn', type=str, default='None', help='Camera serial number for start calibration (default: None)')
+    parser.add_argument('--cache', type=str, default=None, help='Calibration cache directory (default: no cache)')
+    add_processing_arguments(parser)
+    parser.add_argument('--write-zoom', action='store_true', help='Also write zoom index into zoom.conf')
+    args = parser.parse_args()
+
+    metrics.enable_from_env()
+
+    options = ProcessingOptions.from_args(args)
+    service = ZoomService(args.cache, args.write_zoom, options, args.reduced_decode, args.track_disc)
+
+    if args.blue is not None and args.gray is not None:
+        response = service.handle({'cmd': 'calibrate', 'sn': args.sn, 'blue': args.blue, 'gray': args.gray})
+        if 'error' in response:
+            print(response['error'])
+            sys.exit()
+
+    if args.port is not None:
+        server = TCPZoomServer(('127.0.0.1', args.port), ZoomRequestHandler)
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixZoomServer(args.socket, ZoomRequestHandler)
+
+    server.service = service
+    print('Zoom service is ready')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.port is None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+'''Image decoding with the cheapest OpenCV flag for every consumer and cache of decoded variants per file.'''
+
+import collections
+import os
+import struct
+import threading
+
+import cv2
+
+from async_io import read_images
+import metrics
+
+# Consumer -> (cv2.imread flag, reduction factor)
+DECODE_MODES = {
+    # Object/background segmentation works on full resolution BGR difference
+    'color': (cv2.IMREAD_COLOR, 1),
+    # Blue disc masking: disc bounds are multiplied back by 2 (about 1 px error, 4x less pixels for bilateral filter)
+    'calibration': (cv2.IMREAD_REDUCED_COLOR_2, 2),
+    # Work disc detection: HoughCircles already runs on half resolution grayscale background
+    'hough': (cv2.IMREAD_REDUCED_GRAYSCALE_2, 2),
+    # Work disc tracker validation (disc_tracker.DiscTracker with scale 8)
+    'disc_check': (cv2.IMREAD_REDUCED_GRAYSCALE_8, 8),
+}
+
+# JPEG start of frame markers (not DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def image_size(path_to_image):
+    '''Return (height, width) from JPEG or PNG header without decoding, None for other formats.
+    EXIF orientation is not applied.'''
+    with open(path_to_image, 'rb') as image_file:
+        header = image_file.read(24)
+
+        if header[:8] == b'\x89PNG\r\n\x1a\n':
+            width, height = struct.unpack('>II', header[16:24])
+            return (height, width)
+
+        if header[:2] != b'\xff\xd8':
+            return None
+
+        # Walk JPEG segments until start of frame
+        image_file.seek(2)
+        while True:
+            marker = image_file.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            if marker[1] == 0xFF:
+                image_file.seek(-1, os.SEEK_CUR)
+                continue
+            length_bytes = image_file.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = struct.unpack('>H', length_bytes)[0]
+            if marker[1] in _JPEG_SOF_MARKERS:
+                height, width = struct.unpack('>xHH', image_file.read(5))
+                return (height, width)
+            image_file.seek(length - 2, os.SEEK_CUR)
+
+
+def reduce_gray(photo, scale):
+    '''Grayscale photo downscaled by scale: every (scale / 2)-th pixel is taken and 2x2 blocks are averaged
+    (few times cheaper than INTER_AREA over full photo, noise is still averaged).'''
+    height, width = photo.shape[:2]
+    step = max(scale // 2, 1)
+    small = cv2.resize(photo[::step, ::step], (max(width // scale, 1), max(height // scale, 1)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+class ImageDecoder:
+    '''Decode photos per consumer mode (see DECODE_MODES) and keep decoded variants in LRU cache.
+    Cache entries are checked against file modification time and size, so changed files are decoded again.'''
+    def __init__(self, max_entries=6):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    @staticmethod
+    def scale(mode):
+        '''Reduction factor of decode mode: image coordinates are multiplied by it to get full resolution ones.'''
+        return DECODE_MODES[mode][1]
+
+    def _cached(self, key, stamp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != stamp:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, stamp, image):
+        with self.lock:
+            self.entries[key] = (stamp, image)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    @metrics.timed('image_load')
+    def read(self, path_to_image, mode='color', cache=True):
+        '''Decode image for consumer mode. Return None if file can not be read.
+        Cached images are shared between callers and must not be modified.'''
+        try:
+            file_stat = os.stat(path_to_image)
+        except OSError:
+            return None
+        key = (os.path.abspath(path_to_image), mode)
+        stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        image = self._cached(key, stamp)
+        if image is not None:
+            metrics.count('decode_cache_hits')
+            return image
+
+        # Reduced grayscale from already decoded color variant is cheaper than one more decode
+        color = self._cached((key[0], 'color'), stamp) if mode in ('hough', 'disc_check') else None
+        if color is not None and mode == 'hough':
+            image = cv2.resize(cv2.cvtColor(color, cv2.COLOR_BGR2GRAY), (0, 0), fx=0.5, fy=0.5, interpolation=cv2.INTER_CUBIC)
+        elif color is not None:
+            image = reduce_gray(color, self.scale(mode))
+        else:
+            image = cv2.imread(path_to_image, DECODE_MODES[mode][0])
+            metrics.count('decodes')
+
+        if image is not None and cache:
+            self._store(key, stamp, image)
+        return image
+
+    def read_many(self, requests):
+        '''Decode (path, mode) requests on parallel threads. None requests give None images.'''
+        return read_images(requests, read=lambda request: self.read(*request))
+
+    def full_shape(self, path_to_image, image, mode):
+        '''Full resolution shape of photo decoded in mode. Reduced JPEG decode rounds sizes up (other formats down),
+        header size resolves odd sizes (and EXIF rotation, as decoded image shows it).'''
+        scale = self.scale(mode)
+        shape = image.shape
+        if scale == 1:
+            return shape
+
+        header_size = image_size(path_to_image)
+        if header_size is not None:
+            for height, width in (header_size, header_size[::-1]):
+                if shape[:2] in ((-(-height // scale), -(-width // scale)), (height // scale, width // scale)):
+                    return (height, width) + tuple(shape[2:])
+
+        # Unknown format: decode once at full resolution
+        full_image = self.read(path_to_image, 'color')
+        return full_image.shape[:2] + tuple(shape[2:])
+
+    def clear(self):
+        '''Drop all cached images.'''
+        with self.lock:
+            self.entries.clear()
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,162 @@
+'''Work disc geometry tracker: reuse last detected disc circle per camera serial while it still matches background photo.'''
+
+import json
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from bounds import BoundFinder
+from decode import reduce_gray
+import metrics
+
+def state_path(cache_dir=None):
+    '''Tracker state file in calibration cache directory (not evicted with cache entries) or in working directory.'''
+    return os.path.join(cache_dir, 'disc_tracker.state') if cache_dir is not None else 'disc_tracker.state'
+
+
+class DiscTracker:
+    '''Last work disc circle per camera serial. Stored disc outline (circle or fitted ellipse) is validated with edge contrast
+    along it on background downscaled by scale (pairs of samples inside/outside outline). HoughCircles runs only when
+    validation fails, ellipse fit of thresholded small background is fallback for tilted cameras where Hough finds no circle.
+    Disc shift up to about offset * scale px keeps stored circle (mask margin is much wider).
+    Outlines with median edge contrast below min_contrast gray levels are not stored and never validated.
+    With path_to_state, circles are kept in JSON file between runs.'''
+    def __init__(self, path_to_state=None, scale=8, samples=90, offset=2, min_ratio=0.6, min_fraction=0.8, min_contrast=10.0, max_blob_fraction=0.75):
+        self.path_to_state = path_to_state
+        self.scale = scale
+        self.samples = samples
+        self.offset = offset
+        self.min_ratio = min_ratio
+        self.min_fraction = min_fraction
+        self.min_contrast = min_contrast
+        self.max_blob_fraction = max_blob_fraction
+
+        self.lock = threading.Lock()
+        self.states = {}
+
+        if path_to_state is not None:
+            try:
+                with open(path_to_state) as state_file:
+                    self.states = json.load(state_file)
+            except (OSError, ValueError):
+                self.states = {}
+
+    def small_background(self, background_photo):
+        '''Grayscale background downscaled by scale (same as decode.ImageDecoder "disc_check" mode).'''
+        return reduce_gray(background_photo, self.scale)
+
+    def edge_contrast(self, small_gray, ellipse):
+        '''Absolute brightness difference inside/outside ellipse (x, y, semi-axis a, semi-axis b, rotation deg) at full resolution
+        at samples points around it. Points outside small image are dropped.'''
+        xc, yc, axis_a, axis_b = (value / self.scale for value in ellipse[:4])
+        rotation = math.radians(ellipse[4])
+        angles = np.linspace(0, 2 * math.pi, self.samples, endpoint=False)
+        cos, sin = np.cos(angles), np.sin(angles)
+
+        def points(offset):
+            x, y = (axis_a + offset) * cos, (axis_b + offset) * sin
+            return (np.rint(xc + x * math.cos(rotation) - y * math.sin(rotation)).astype(int),
+                    np.rint(yc + x * math.sin(rotation) + y * math.cos(rotation)).astype(int))
+
+        height, width = small_gray.shape[:2]
+        inner_x, inner_y = points(-self.offset)
+        outer_x, outer_y = points(self.offset)
+
+        inside = (inner_x >= 0) & (inner_x < width) & (inner_y >= 0) & (inner_y < height) & \
+                 (outer_x >= 0) & (outer_x < width) & (outer_y >= 0) & (outer_y < height)
+
+        inner = small_gray[inner_y[inside], inner_x[inside]].astype(np.float32)
+        outer = small_gray[outer_y[inside], outer_x[inside]].astype(np.float32)
+        return np.abs(inner - outer)
+
+    def validate(self, small_gray, state):
+        '''True if stored disc outline still lies on strong edge of small background.'''
+        contrast = self.edge_contrast(small_gray, state['ellipse'])
+        if contrast.size < self.samples // 2 or state['contrast'] < self.min_contrast:
+            return False
+
+        # Most of circle must keep edge, and typical contrast must not drop much (disc moved or light changed)
+        strong = contrast >= self.min_ratio * state['contrast']
+        return strong.mean() >= self.min_fraction and np.median(contrast) >= max(self.min_ratio * state['contrast'], self.min_contrast)
+
+    def fit_ellipse(self, small_gray):
+        '''Fit ellipse to biggest bright blob of small background (Otsu threshold).
+        Return ellipse (x, y, semi-axis a, semi-axis b, rotation deg) at full resolution or None.
+        Blobs touching frame border or covering more than max_blob_fraction of frame are not disc (no disc, uniform background).'''
+        blurred = cv2.GaussianBlur(small_gray, (5, 5), 0)
+        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        if not contours:
+            return None
+
+        contour = max(contours, key=cv2.contourArea)
+        # Blob must be big enough to be work disc (5% of frame)
+        frame_area = small_gray.shape[0] * small_gray.shape[1]
+        if len(contour) < 5 or not 0.05 * frame_area <= cv2.contourArea(contour) <= self.max_blob_fraction * frame_area:
+            return None
+
+        x, y, width, height = cv2.boundingRect(contour)
+        if x == 0 or y == 0 or x + width == small_gray.shape[1] or y + height == small_gray.shape[0]:
+            return None
+
+        (xc, yc), (width, height), rotation = cv2.fitEllipse(contour)
+        return (xc * self.scale, yc * self.scale, width / 2 * self.scale, height / 2 * self.scale, rotation)
+
+    @metrics.timed('disc_tracking')
+    def find_disc_circle(self, serial_number, bound_finder, angle, small_gray=None, detect=None):
+        '''Same result contract as BoundFinder.find_disc_circle: (x, y, radius) with margin or None.
+        small_gray: background downscaled by scale (optional), detect: function returning detected full resolution circle
+        (bound_finder.detect_disc_circle by default).'''
+        if angle <= BoundFinder.DISC_MIN_ANGLE:
+            return None
+
+        serial_number = str(serial_number)
+        shape = list(bound_finder.background_photo.shape[:2])
+        if small_gray is None:
+            small_gray = self.small_background(bound_finder.background_photo)
+
+        with self.lock:
+            state = self.states.get(serial_number)
+
+        if state is not None and state['shape'] == shape and self.validate(small_gray, state):
+            metrics.count('disc_tracker_hits')
+            circle = state['circle']
+        else:
+            metrics.count('disc_tracker_misses')
+            circle = detect() if detect is not None else bound_finder.detect_disc_circle()
+            if circle is not None:
+                ellipse = (circle[0], circle[1], circle[2], circle[2], 0.0)
+            else:
+                # Tilted camera: disc is ellipse, mask uses circle covering it (semi-major axis)
+                ellipse = self.fit_ellipse(small_gray)
+                if ellipse is None:
+                    return None
+                metrics.count('disc_ellipse_fits')
+                circle = (int(round(ellipse[0])), int(round(ellipse[1])), int(round(max(ellipse[2], ellipse[3]))))
+
+            contrast = self.edge_contrast(small_gray, ellipse)
+            contrast = float(np.median(contrast)) if contrast.size else 0.0
+            # Faint outline would validate against noise, it is detected again next time
+            if contrast >= self.min_contrast:
+                self.store(serial_number, {'circle': list(circle), 'ellipse': [float(value) for value in ellipse],
+                                           'contrast': contrast, 'shape': shape})
+
+        return (int(circle[0]), int(circle[1]), int(circle[2]) - BoundFinder.DISC_MARGIN)
+
+    def store(self, serial_number, state):
+        '''Save circle state for camera serial (atomic state file write).'''
+        with self.lock:
+            self.states[str(serial_number)] = state
+            if self.path_to_state is None:
+                return
+
+            temp_path = self.path_to_state + '.' + str(os.getpid()) + '.tmp'
+            with open(temp_path, 'w') as state_file:
+                json.dump(self.states, state_file)
+            os.replace(temp_path, self.path_to_state)
+
+if __name__ == '__main__':
+    pass
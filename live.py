@@ -0,0 +1,241 @@
+'''Live preview mode: object bounds on frame stream with running background model and incremental segmentation.
+Zoom index is emitted as soon as object bounding box is stable for several frames.'''
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from camera_profiles import ProfileRegistry
+from bounds import BoundFinder
+from pipeline import calibrate
+from calibration_cache import CalibrationCache
+from arena import BufferArena
+from decode import reduce_gray
+from batch import IMAGE_EXTENSIONS
+import metrics
+
+def open_frames(source):
+    '''Yield BGR frames from camera index ("0"), video file or stream URL, or directory of images (file-backed camera stand-in).'''
+    if os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, file_name))
+                if frame is not None:
+                    yield frame
+        return
+
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+class LiveTracker:
+    '''Incremental object bounds for frame stream of one calibrated camera.
+    Changed regions are found on frames downscaled by scale, only these regions (plus filter halo) are binarized again
+    and written into persistent object mask. Background model is running average of frames outside object mask,
+    updated every background_every frames together with full mask refresh.'''
+    def __init__(self, calculator, calibration, background, stable_frames=5, tolerance_px=4, scale=8, change_threshold=8,
+                 learning_rate=0.05, background_every=30, min_area=1000):
+        self.calculator = calculator
+        self.calibration = calibration
+        self.stable_frames = stable_frames
+        self.tolerance_px = tolerance_px
+        self.scale = scale
+        self.change_threshold = change_threshold
+        self.learning_rate = learning_rate
+        self.background_every = background_every
+        self.min_area = min_area
+
+        self.background_model = background.astype(np.float32)
+        self.background = background.copy()
+        self.disc_mask = calibration.disc_mask
+        # Filter kernels reach: opening 5x5, bilateral filter 9 and 3x3 gaussian
+        self.halo = 9 + 8
+
+        self.arena = BufferArena(max_shapes=4)
+        self.mask = None
+        self.previous_small = None
+        self.frames = 0
+
+        self.history = collections.deque(maxlen=stable_frames)
+        self.emitted_bounds = None
+
+    @classmethod
+    def for_frames(cls, calculator, calibration, frame_shape, **kwargs):
+        '''Tracker for frames of frame_shape: background photo and work disc mask are resized to frame size if needed.'''
+        height, width = frame_shape[:2]
+        background = calculator.background_image
+        if background.shape[:2] != (height, width):
+            background = cv2.resize(background, (width, height), interpolation=cv2.INTER_AREA)
+
+        tracker = cls(calculator, calibration, background, **kwargs)
+        if tracker.disc_mask.shape[:2] != (height, width):
+            tracker.disc_mask = cv2.resize(tracker.disc_mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        return tracker
+
+    @metrics.timed('live_change')
+    def changed_regions(self, frame):
+        '''Rectangles (x_from, y_from, x_to, y_to) at frame resolution which changed since previous frame.'''
+        small = reduce_gray(frame, self.scale)
+        previous_small, self.previous_small = self.previous_small, small
+        if previous_small is None:
+            return [(0, 0, frame.shape[1], frame.shape[0])]
+
+        changed = cv2.absdiff(small, previous_small) > self.change_threshold
+        if not changed.any():
+            return []
+
+        # Join close changes, one rectangle per changed blob
+        changed = cv2.dilate(changed.astype(np.uint8), np.ones((3, 3), np.uint8))
+        contours, _ = cv2.findContours(changed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        height, width = frame.shape[:2]
+        regions = []
+        for contour in contours:
+            x, y, region_width, region_height = cv2.boundingRect(contour)
+            regions.append((x * self.scale, y * self.scale, min((x + region_width) * self.scale, width), min((y + region_height) * self.scale, height)))
+        return regions
+
+    def segment_region(self, frame, region):
+        '''Binarize frame region (with halo) against background model and write it into persistent mask.'''
+        x_from, y_from, x_to, y_to = region
+        height, width = frame.shape[:2]
+        crop_x_from, crop_y_from = max(x_from - self.halo, 0), max(y_from - self.halo, 0)
+        crop_x_to, crop_y_to = min(x_to + self.halo, width), min(y_to + self.halo, height)
+
+        crop_mask = BoundFinder.binarize_into(frame[crop_y_from:crop_y_to, crop_x_from:crop_x_to],
+                                              self.background[crop_y_from:crop_y_to, crop_x_from:crop_x_to], 9, 100, self.arena)
+        crop_mask = crop_mask[y_from - crop_y_from:y_to - crop_y_from, x_from - crop_x_from:x_to - crop_x_from]
+        cv2.bitwise_and(crop_mask, self.disc_mask[y_from:y_to, x_from:x_to], dst=self.mask[y_from:y_to, x_from:x_to])
+
+    def update_background(self, frame):
+        '''Blend frame into background model outside object mask (dilated to keep object shadows out).'''
+        outside = cv2.bitwise_not(cv2.dilate(self.mask, np.ones((15, 15), np.uint8)))
+        cv2.accumulateWeighted(frame, self.background_model, self.learning_rate, mask=outside)
+        self.background = cv2.convertScaleAbs(self.background_model)
+
+    def process_frame(self, frame):
+        '''Update object mask and bounds with next frame. Return zoom result dictionary when bounds became stable, else None.'''
+        self.frames += 1
+        if self.mask is None:
+            self.mask = np.zeros(frame.shape[:2], np.uint8)
+
+        # Periodic background update changes every pixel of difference image, refresh whole mask then
+        if self.frames % self.background_every == 0:
+            self.update_background(frame)
+            regions = [(0, 0, frame.shape[1], frame.shape[0])]
+            self.previous_small = reduce_gray(frame, self.scale)
+        else:
+            regions = self.changed_regions(frame)
+
+        with metrics.stage('segmentation'):
+            for region in regions:
+                self.segment_region(frame, region)
+        metrics.count('live_regions', len(regions))
+
+        try:
+            bounds = BoundFinder(None, None).find_object_bounds_components(self.mask, self.min_area)
+        except ValueError:
+            # No object on work disc
+            self.history.clear()
+            self.emitted_bounds = None
+            return None
+
+        self.history.append(bounds)
+        if len(self.history) < self.stable_frames or max(BoundFinder.bounds_error(bounds, previous) for previous in self.history) > self.tolerance_px:
+            return None
+
+        # Emit once per stable position
+        if self.emitted_bounds is not None and BoundFinder.bounds_error(self.emitted_bounds, bounds) <= self.tolerance_px:
+            return None
+        self.emitted_bounds = bounds
+
+        return self.zoom(frame, bounds)
+
+    @metrics.timed('zoom_math')
+    def zoom(self, frame, bounds):
+        '''Virtual bounds, object size and zoom index for stable bounds. Frame pixels are scaled to calibration photo pixels.'''
+        virtual_bounds = BoundFinder(None, frame).find_virtual_bounds(*bounds)
+
+        scale_x = self.calculator.calibration_shape[1] / frame.shape[1]
+        scale_y = self.calculator.calibration_shape[0] / frame.shape[0]
+        big_width, big_height = int(round(virtual_bounds[2] * scale_x)), int(round(virtual_bounds[3] * scale_y))
+
+        distance = self.calibration.camera_distance_mm
+        object_width_mm, object_height_mm = self.calculator.calculate_object_size(big_width, big_height, distance)
+        zoom_index = self.calculator.calc_zoom(big_width, big_height, object_width_mm, object_height_mm, distance, write_file=False)
+
+        return {
+            'frame': self.frames,
+            'object_bounds': list(bounds),
+            'virtual_bounds': list(virtual_bounds),
+            'object_width_mm': object_width_mm,
+            'object_height_mm': object_height_mm,
+            'zoom_index': zoom_index,
+        }
+
+
+def main():
+    '''Live mode entry point'''
+    parser = argparse.ArgumentParser(description='Live zoom preview on video frames')
+    parser.add_argument('--blue', type=str, required=True, help='Blue disc photo name')
+    parser.add_argument('--gray', type=str, required=True, help='Gray disc photo name (initial background model)')
+    parser.add_argument('--source', type=str, required=True, help='Camera index, video file/stream or directory of frame images')
+    parser.add_argument('--sn', type=str, default='None', help='Camera serial number (default: None)')
+    parser.add_argument('--cache', type=str, default=None, help='Calibration cache directory (default: no cache)')
+    parser.add_argument('--stable-frames', type=int, default=5, help='Frames with the same bounding box before zoom is emitted (default: 5)')
+    parser.add_argument('--tolerance', type=int, default=4, help='Allowed bounding box edge movement for stable box, px (default: 4)')
+    parser.add_argument('--change-scale', type=int, default=8, help='Downscale factor for changed region detection (default: 8)')
+    parser.add_argument('--write-zoom', action='store_true', help='Also write emitted zoom index into zoom.conf')
+    args = parser.parse_args()
+
+    # Stdout carries JSON lines only: prints of calculator and bound finder (and errors) go to stderr
+    results_file = sys.stdout
+    sys.stdout = sys.stderr
+
+    metrics.enable_from_env()
+
+    calculator = ProfileRegistry().calculator(args.sn)
+    calculator.load_images(args.blue, args.gray, serial_number=args.sn, read_calibration=args.cache is None)
+
+    if calculator.background_image is None:
+        print('File is not found')
+        sys.exit()
+
+    try:
+        calibration = calibrate(calculator, CalibrationCache(args.cache) if args.cache is not None else None)
+    except ValueError as error:
+        print(error)
+        sys.exit()
+
+    tracker = None
+    start = time.perf_counter()
+    for frame in open_frames(args.source):
+        if tracker is None:
+            tracker = LiveTracker.for_frames(calculator, calibration, frame.shape, stable_frames=args.stable_frames,
+                                             tolerance_px=args.tolerance, scale=args.change_scale)
+        result = tracker.process_frame(frame)
+        if result is not None:
+            if args.write_zoom:
+                calculator.write_zoom(result['zoom_index'])
+            print(json.dumps(result), file=results_file, flush=True)
+        metrics.flush({'mode': 'live', 'sn': args.sn})
+
+    frames = tracker.frames if tracker is not None else 0
+    elapsed = time.perf_counter() - start
+    print('{} frames, {:.1f} fps'.format(frames, frames / elapsed if elapsed > 0 else 0.0), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+'''Optional per-stage timing and counters with JSON-lines and Prometheus textfile export.
+
+Disabled by default: stage() returns shared no-op context and timed() functions do one global check.
+Enable from environment (see enable_from_env) or with enable():
+    AUTOZOOM_METRICS         JSON-lines file, one record per run (photo)
+    AUTOZOOM_METRICS_PROM    Prometheus textfile collector file with cumulative totals
+    AUTOZOOM_METRICS_MEMORY  "1" to trace per-stage peak memory with tracemalloc (slower)
+'''
+
+import contextlib
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+class _NullStage:
+    '''No-op stage context used when metrics are disabled.'''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Active recorder, None when metrics are disabled
+_recorder = None
+
+
+class MetricsRecorder:
+    '''Collect wall time, CPU time and peak memory per stage plus named counters.
+    CPU time is time of the thread running the stage (service threads do not count each other), OpenCV worker threads are not included.
+    Current run records are kept per thread, so every service thread flushes its own photo.
+    Nested stage with the same name (e.g. load_images calling read_calibration_image) is counted once.'''
+    def __init__(self, path_to_jsonl=None, path_to_prometheus=None, trace_memory=False):
+        self.path_to_jsonl = path_to_jsonl
+        self.path_to_prometheus = path_to_prometheus
+        self.trace_memory = trace_memory
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # Totals since start for Prometheus export
+        self.total_stages = {}
+        self.total_counters = {}
+        self.runs = 0
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _run(self):
+        '''Current thread run records: (active stages, stage -> [calls, wall s, cpu s, peak bytes], counter -> value).'''
+        run = getattr(self.local, 'run', None)
+        if run is None:
+            run = self.local.run = (set(), {}, {})
+        return run
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Measure block as stage name.'''
+        active, stages, _ = self._run()
+
+        if name in active:
+            yield
+            return
+
+        active.add(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            # Traced peak of stage or process peak RSS so far (ru_maxrss is KB on Linux)
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            active.discard(name)
+
+            record = stages.setdefault(name, [0, 0.0, 0.0, 0])
+            record[0] += 1
+            record[1] += wall
+            record[2] += cpu
+            record[3] = max(record[3], peak)
+
+    def count(self, name, value=1):
+        '''Add value to counter name.'''
+        counters = self._run()[2]
+        counters[name] = counters.get(name, 0) + value
+
+    def take(self):
+        '''Return and reset current thread run records (stages, counters), e.g. to send them from worker process.'''
+        _, stages, counters = self._run()
+        self.local.run = None
+        return stages, counters
+
+    def merge(self, stages, counters):
+        '''Add run records taken in other thread or process to current thread run.'''
+        _, own_stages, own_counters = self._run()
+        for name, (calls, wall, cpu, peak) in stages.items():
+            record = own_stages.setdefault(name, [0, 0.0, 0.0, 0])
+            record[0] += calls
+            record[1] += wall
+            record[2] += cpu
+            record[3] = max(record[3], peak)
+        for name, value in counters.items():
+            own_counters[name] = own_counters.get(name, 0) + value
+
+    def flush(self, labels=None):
+        '''Finish current thread run: append JSON line, update Prometheus totals file and reset run records.'''
+        stages, counters = self.take()
+
+        with self.lock:
+            for name, (calls, wall, cpu, peak) in stages.items():
+                total = self.total_stages.setdefault(name, [0, 0.0, 0.0, 0])
+                total[0] += calls
+                total[1] += wall
+                total[2] += cpu
+                total[3] = max(total[3], peak)
+            for name, value in counters.items():
+                self.total_counters[name] = self.total_counters.get(name, 0) + value
+            self.runs += 1
+
+            if self.path_to_jsonl is not None:
+                record = {
+                    'time': time.time(),
+                    'labels': labels or {},
+                    'stages': {name: {'calls': calls, 'wall_s': wall, 'cpu_s': cpu, 'peak_bytes': peak} for name, (calls, wall, cpu, peak) in stages.items()},
+                    'counters': counters,
+                }
+                with open(self.path_to_jsonl, 'a') as jsonl_file:
+                    jsonl_file.write(json.dumps(record) + '\n')
+
+            if self.path_to_prometheus is not None:
+                self._write_prometheus()
+
+    def _write_prometheus(self):
+        '''Write cumulative totals in Prometheus text format (atomic rename for textfile collector).'''
+        lines = [
+            '# HELP autozoom_runs_total Processed runs (photos).',
+            '# TYPE autozoom_runs_total counter',
+            'autozoom_runs_total {}'.format(self.runs),
+            '# HELP autozoom_stage_calls_total Stage calls.',
+            '# TYPE autozoom_stage_calls_total counter',
+        ]
+        lines += ['autozoom_stage_calls_total{{stage="{}"}} {}'.format(name, total[0]) for name, total in sorted(self.total_stages.items())]
+        lines += ['# HELP autozoom_stage_seconds_total Stage wall time.', '# TYPE autozoom_stage_seconds_total counter']
+        lines += ['autozoom_stage_seconds_total{{stage="{}"}} {:.6f}'.format(name, total[1]) for name, total in sorted(self.total_stages.items())]
+        lines += ['# HELP autozoom_stage_cpu_seconds_total Stage CPU time of calling thread.', '# TYPE autozoom_stage_cpu_seconds_total counter']
+        lines += ['autozoom_stage_cpu_seconds_total{{stage="{}"}} {:.6f}'.format(name, total[2]) for name, total in sorted(self.total_stages.items())]
+        lines += ['# HELP autozoom_stage_peak_memory_bytes Maximal stage peak memory.', '# TYPE autozoom_stage_peak_memory_bytes gauge']
+        lines += ['autozoom_stage_peak_memory_bytes{{stage="{}"}} {}'.format(name, total[3]) for name, total in sorted(self.total_stages.items())]
+        lines += ['# HELP autozoom_events_total Pipeline counters (contours, hough circles, ...).', '# TYPE autozoom_events_total counter']
+        lines += ['autozoom_events_total{{name="{}"}} {}'.format(name, value) for name, value in sorted(self.total_counters.items())]
+
+        temp_path = self.path_to_prometheus + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'w') as prometheus_file:
+            prometheus_file.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.path_to_prometheus)
+
+
+def stage(name):
+    '''Context manager measuring block as stage name (no-op when metrics are disabled).'''
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_STAGE
+    return recorder.stage(name)
+
+def count(name, value=1):
+    '''Add value to counter name (no-op when metrics are disabled).'''
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, value)
+
+def flush(labels=None):
+    '''Finish current run record (no-op when metrics are disabled).'''
+    recorder = _recorder
+    if recorder is not None:
+        recorder.flush(labels)
+
+def enabled():
+    '''True if metrics are recorded.'''
+    return _recorder is not None
+
+def take():
+    '''Return and reset current run records, empty records when metrics are disabled.'''
+    recorder = _recorder
+    if recorder is None:
+        return {}, {}
+    return recorder.take()
+
+def merge(stages, counters):
+    '''Add run records taken in worker process to current run (no-op when metrics are disabled).'''
+    recorder = _recorder
+    if recorder is not None:
+        recorder.merge(stages, counters)
+
+def timed(name):
+    '''Decorator measuring every call of function as stage name.'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return function(*args, **kwargs)
+            with recorder.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def enable(path_to_jsonl=None, path_to_prometheus=None, trace_memory=False):
+    '''Enable metrics recording, return recorder.'''
+    global _recorder
+    _recorder = MetricsRecorder(path_to_jsonl, path_to_prometheus, trace_memory)
+    return _recorder
+
+def disable():
+    '''Disable metrics recording.'''
+    global _recorder
+    _recorder = None
+
+def enable_from_env():
+    '''Enable metrics if AUTOZOOM_METRICS (JSONL file) or AUTOZOOM_METRICS_PROM (Prometheus text file) environment variable is set.
+    Called once by command line entry points, metrics stay disabled otherwise.'''
+    path_to_jsonl = os.environ.get('AUTOZOOM_METRICS')
+    path_to_prometheus = os.environ.get('AUTOZOOM_METRICS_PROM')
+    if path_to_jsonl or path_to_prometheus:
+        return enable(path_to_jsonl, path_to_prometheus, os.environ.get('AUTOZOOM_METRICS_MEMORY') == '1')
+    return None
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,133 @@
+'''Process pool executor for batch mode: object photos are processed on all CPU cores.'''
+
+import collections
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from zoom import Calculator
+from pipeline import Calibration, BatchProcessor
+import metrics
+
+class SharedArray:
+    '''Numpy array placed in shared memory, so worker processes can attach to it without pickling.'''
+    def __init__(self, array):
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)[...] = array
+
+    def descriptor(self):
+        '''Small picklable descriptor for attach().'''
+        return (self.shm.name, self.shape, self.dtype)
+
+    @staticmethod
+    def attach(descriptor):
+        '''Attach to shared array in worker process. Return (shared memory handle, read only array view).'''
+        name, shape, dtype = descriptor
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        return shm, array
+
+    def close(self):
+        '''Release and remove shared memory block.'''
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Per worker process state, filled by _init_worker
+_worker = {}
+
+def _init_worker(calculator_state, calibration_state, background_descriptor, mask_descriptor, bounding_image_dir, options, metrics_enabled, quiet):
+    '''Build calculator and batch processor in worker using shared background image and disc mask.'''
+    # Results are streamed to stdout by parent process, worker prints go to stderr
+    if quiet:
+        sys.stdout = sys.stderr
+
+    # Parallelism comes from processes, avoid oversubscription by OpenCV threads
+    cv2.setNumThreads(1)
+
+    # Worker records metrics in memory and sends them with every result
+    if metrics_enabled:
+        metrics.enable()
+
+    sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length, calibration_shape = calculator_state
+    calculator = Calculator(sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length)
+    calculator.calibration_shape = calibration_shape
+
+    background_shm, calculator.background_image = SharedArray.attach(background_descriptor)
+    mask_shm, disc_mask = SharedArray.attach(mask_descriptor)
+
+    camera_distance_mm, camera_angle_deg, disc_circle = calibration_state
+    calibration = Calibration(camera_distance_mm, camera_angle_deg, disc_circle, disc_mask.shape, disc_mask)
+
+    # Keep shared memory handles alive as long as worker lives
+    _worker['shm'] = (background_shm, mask_shm)
+    _worker['processor'] = BatchProcessor(calculator, calibration, bounding_image_dir, options)
+
+def _process_entry(entry):
+    '''Worker task: read and process one object photo.'''
+    path_to_object_image, serial_number = entry
+    result = _worker['processor'].process(path_to_object_image, serial_number)
+    return result, metrics.take()
+
+
+class ParallelProcessor:
+    '''Process object photos on process pool. Results are yielded in input order.
+    At most max_pending photos are in flight to keep memory bounded. With quiet, prints of workers go to stderr.'''
+    def __init__(self, calculator, calibration, bounding_image_dir=None, workers=None, max_pending=None, options=None, quiet=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+
+        # Share background image and disc mask with workers
+        self.shared_background = SharedArray(calculator.background_image)
+        self.shared_mask = SharedArray(calibration.disc_mask)
+
+        calculator_state = (calculator.sensor_wight_mm, calculator.sensor_height_mm, calculator.sensor_wight_px, calculator.sensor_height_px,
+                            calculator.disc_diameter_m, tuple(calculator.possible_focal_length), tuple(calculator.calibration_shape))
+        calibration_state = (calibration.camera_distance_mm, calibration.camera_angle_deg, calibration.disc_circle)
+
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(calculator_state, calibration_state, self.shared_background.descriptor(),
+                                                      self.shared_mask.descriptor(), bounding_image_dir, options, metrics.enabled(), quiet))
+
+    def run(self, entries):
+        '''Yield results for (object image path, serial number) pairs in input order.
+        Worker metrics of every photo are merged into current run of this process.'''
+        pending = collections.deque()
+
+        for entry in entries:
+            pending.append(self.executor.submit(_process_entry, entry))
+
+            # Back-pressure: wait for oldest result before submitting more work
+            if len(pending) >= self.max_pending:
+                yield self._collect(pending.popleft())
+
+        while pending:
+            yield self._collect(pending.popleft())
+
+    @staticmethod
+    def _collect(future):
+        result, (stages, counters) = future.result()
+        metrics.merge(stages, counters)
+        return result
+
+    def close(self):
+        '''Stop workers and release shared memory.'''
+        self.executor.shutdown()
+        self.shared_background.close()
+        self.shared_mask.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+if __name__ == '__main__':
+    pass
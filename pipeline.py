@@ -0,0 +1,422 @@
+'''Calibration and object processing steps shared by single shot and batch modes.'''
+
+import os
+
+import cv2
+import numpy as np
+
+from bounds import BoundFinder
+from arena import BufferArena
+from async_io import ImagePrefetcher
+import metrics
+
+# Two-tier boxes smaller than this (px, 4x min_area of find_object_bounds) always go to full path:
+# close to min_area, coarse pass can't tell whether full resolution path keeps the object
+FIRST_PASS_MIN_BOX_AREA = 4000
+
+# Calculator and BoundFinder call sys.exit() on calculation errors: batch, rig and service callers
+# record these as per-photo errors and keep running
+CALCULATION_ERRORS = (ArithmeticError, ValueError, SystemExit, cv2.error)
+
+class Calibration:
+    '''Calibration products for one rig: camera distance, camera angle and work disc mask.'''
+    def __init__(self, camera_distance_mm, camera_angle_deg, disc_circle, mask_shape, disc_mask=None):
+        self.camera_distance_mm = camera_distance_mm
+        self.camera_angle_deg = camera_angle_deg
+        self.disc_circle = disc_circle
+        self.mask_shape = mask_shape
+
+        # Work disc mask is cheap to rebuild from circle geometry
+        self.disc_mask = disc_mask if disc_mask is not None else BoundFinder.disc_mask(mask_shape, disc_circle)
+
+    @classmethod
+    def from_calculator(cls, calculator, tracker=None):
+        '''Run calibration chain for images loaded into calculator (blue disc and gray background).
+        With tracker (disc_tracker.DiscTracker), last work disc circle of camera is reused while it matches background.'''
+        # Find bounds for calibration disc
+        calibration_bounds = BoundFinder(calculator.background_image, calculator.calibration_image)
+        processed_photo_calibration = calibration_bounds.blue_color_masking()
+        _, _, disc_width, disc_height = calibration_bounds.find_object_bounds(processed_photo_calibration)
+
+        # Calibration photo may be decoded at reduced resolution
+        disc_width, disc_height = disc_width * calculator.calibration_scale, disc_height * calculator.calibration_scale
+
+        # Calculate camera distance and camera angle
+        camera_distance_mm = calculator.calculate_camera_distance(disc_width, disc_height)
+        camera_angle_deg = calculator.calculate_camera_angle(disc_width, disc_height)
+
+        #If we take photo from top - camera angle > 75deg (15deg possible error error), apply cv2.HoughCircles and create mask
+        def read_background(mode):
+            return calculator.decoder.read(calculator.path_to_background_image, mode) if calculator.decoder is not None else None
+
+        if tracker is not None:
+            # Hough input is prepared only when stored circle is not valid anymore
+            disc_circle = tracker.find_disc_circle(calculator.serial_number, calibration_bounds, camera_angle_deg, read_background('disc_check'),
+                                                   lambda: calibration_bounds.detect_disc_circle(read_background('hough')))
+        else:
+            disc_circle = calibration_bounds.find_disc_circle(camera_angle_deg, read_background('hough'))
+
+        return cls(camera_distance_mm, camera_angle_deg, disc_circle, calculator.calibration_shape[:2])
+
+    def to_dict(self):
+        '''Serialize calibration products for calibration cache.'''
+        return {
+            'camera_distance_mm': self.camera_distance_mm,
+            'camera_angle_deg': self.camera_angle_deg,
+            'disc_circle': list(self.disc_circle) if self.disc_circle is not None else None,
+            'mask_shape': list(self.mask_shape),
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        '''Restore calibration products from calibration cache record.'''
+        disc_circle = tuple(record['disc_circle']) if record['disc_circle'] is not None else None
+        return cls(record['camera_distance_mm'], record['camera_angle_deg'], disc_circle, tuple(record['mask_shape']))
+
+
+def _read_calibration_image(calculator):
+    '''Read calibration image if it is not loaded yet. Raise ValueError if it cannot be read.'''
+    if calculator.calibration_image is None:
+        calculator.read_calibration_image()
+
+    if calculator.calibration_image is None:
+        raise ValueError('File is not found')
+
+
+def calibrate(calculator, cache=None, tracker=None):
+    '''Select camera orientation and return calibration products for calculator images.
+    With calibration cache, calibration image is read and processed only on cache miss.
+    Optional work disc tracker replaces HoughCircles while stored disc circle of camera still matches.
+    Raise ValueError when calibration or background image file is not found.'''
+    if cache is None:
+        _read_calibration_image(calculator)
+        calculator.select_camera_orientation()
+        return Calibration.from_calculator(calculator, tracker)
+
+    # Key is built before orientation swap, so it always uses settings values as they are in settings file
+    settings_values = calculator.profile.settings_values()
+    # Reduced resolution calibration gives slightly different products, keep them apart
+    if calculator.decoder is not None:
+        settings_values.append('reduced_decode')
+    try:
+        key = cache.make_key(calculator.serial_number, calculator.path_to_calibration_image, calculator.path_to_background_image, settings_values)
+    except OSError:
+        raise ValueError('File is not found')
+
+    record = cache.load(key)
+    if record is not None:
+        calculator.calibration_shape = tuple(record['calibration_shape'])
+        calculator.select_camera_orientation()
+        return Calibration.from_dict(record)
+
+    _read_calibration_image(calculator)
+    calculator.select_camera_orientation()
+    calibration = Calibration.from_calculator(calculator, tracker)
+
+    record = calibration.to_dict()
+    record['calibration_shape'] = list(calculator.calibration_shape)
+    cache.store(key, record)
+
+    return calibration
+
+
+class ProcessingOptions:
+    '''Segmentation and bound detection modes for object photos. Defaults reproduce reference full resolution path.
+    segmentation: "full", "pyramid" (segment at 1/pyramid_scale and refine box edges at full resolution)
+    or "tiled" (binarize in strips of tile_rows rows with halo, same bounds as "full" with bounded memory)
+    or "two_tier" (zoom from bounds at 1/first_pass_scale, full path only when focal interval of coarse box
+    crosses focal table value: box edges are moved inwards by first_pass_bias coarse px of filter spread
+    and known with +-first_pass_margin coarse px precision).
+    compare_full: also run reference path and report bounding box error of selected mode.
+    in_place: binarize full resolution photos in reusable buffer arena (same masks, no per-photo allocations).
+    roi_crop: process only work disc bounding square plus roi_margin px (when work disc is detected).
+    bounds_engine: "contours" (reference) or "components" (vectorized connected components statistics).'''
+    def __init__(self, segmentation='full', pyramid_scale=4, compare_full=False, in_place=False, roi_crop=False, roi_margin=32, bounds_engine='contours', tile_rows=512,
+                 first_pass_scale=4, first_pass_bias=2, first_pass_margin=1.5):
+        self.segmentation = segmentation
+        self.pyramid_scale = pyramid_scale
+        self.compare_full = compare_full
+        self.in_place = in_place
+        self.roi_crop = roi_crop
+        self.roi_margin = roi_margin
+        self.bounds_engine = bounds_engine
+        self.tile_rows = tile_rows
+        self.first_pass_scale = first_pass_scale
+        self.first_pass_bias = first_pass_bias
+        self.first_pass_margin = first_pass_margin
+
+    @classmethod
+    def from_args(cls, args):
+        '''Options from command line arguments added by add_processing_arguments() (and --compare-full if parser has it).'''
+        return cls(args.segmentation, args.pyramid_scale, getattr(args, 'compare_full', False), getattr(args, 'in_place', False), args.roi,
+                   bounds_engine=args.bounds_engine, tile_rows=args.tile_rows,
+                   first_pass_scale=args.first_pass_scale, first_pass_bias=args.first_pass_bias, first_pass_margin=args.first_pass_margin)
+
+
+def add_processing_arguments(parser, in_place=True):
+    '''Add object processing (ProcessingOptions) and calibration decode options shared by command line modes to argparse parser.
+    in_place: also add --in-place (modes which keep buffer arena between photos).'''
+    parser.add_argument('--segmentation', type=str, default='full', choices=('full', 'pyramid', 'tiled', 'two_tier'), help='Segmentation mode (default: full)')
+    parser.add_argument('--pyramid-scale', type=int, default=4, help='Downscale factor for pyramid segmentation (default: 4)')
+    parser.add_argument('--tile-rows', type=int, default=512, help='Strip height for tiled segmentation, px (default: 512)')
+    parser.add_argument('--first-pass-scale', type=int, default=4, help='Downscale factor for two-tier first pass (default: 4)')
+    parser.add_argument('--first-pass-bias', type=float, default=2, help='Two-tier first pass box edge bias (filter spread), first pass px (default: 2)')
+    parser.add_argument('--first-pass-margin', type=float, default=1.5, help='Two-tier box edge error bound, first pass px (default: 1.5)')
+    if in_place:
+        parser.add_argument('--in-place', action='store_true', help='Binarize photos in reusable buffers (lower memory, same masks)')
+    parser.add_argument('--roi', action='store_true', help='Process only work disc bounding square of object photos')
+    parser.add_argument('--bounds-engine', type=str, default='contours', choices=('contours', 'components'), help='Object bounds engine (default: contours)')
+    parser.add_argument('--reduced-decode', action='store_true', help='Decode calibration and Hough photos at half resolution')
+    parser.add_argument('--track-disc', action='store_true', help='Reuse last work disc circle of camera while it matches background')
+
+
+def reference_bounds(object_bounds, disc_mask, arena=None, engine='contours'):
+    '''Reference full resolution path: binarize photo, apply work disc mask and find bounds.
+    Return (bounds, processed photo).'''
+    processed_photo_object = object_bounds.prepare_image(9, 100, arena)
+
+    #Apply mask (in arena buffer if it is used)
+    processed_photo_object = cv2.bitwise_and(processed_photo_object, disc_mask, dst=processed_photo_object if arena is not None else None)
+
+    return object_bounds.find_object_bounds(processed_photo_object, engine=engine), processed_photo_object
+
+
+def box_inside_mask(bounds, shape, disc_circle, reach):
+    '''True if box grown by reach px lies inside frame of shape and inside work disc mask circle (if any).
+    Object edges cut by mask or frame have no filter spread, so first pass bias is not known there.'''
+    x_from, y_from = bounds[0] - reach, bounds[1] - reach
+    x_to, y_to = bounds[0] + bounds[2] + reach, bounds[1] + bounds[3] + reach
+    if x_from < 0 or y_from < 0 or x_to > shape[1] or y_to > shape[0]:
+        return False
+    if disc_circle is None:
+        return True
+
+    xc, yc, radius = disc_circle
+    return all((x - xc)**2 + (y - yc)**2 <= radius**2 for x in (x_from, x_to) for y in (y_from, y_to))
+
+
+def focal_interval(calculator, calibration, shape, bounds, error_px):
+    '''Estimated focal interval (mm) of object whose box edges are known with +-error_px precision:
+    virtual bounds and focals of every box with edges at -error_px, 0 and +error_px.
+    Return (lowest focal, highest focal, True if zoom index is the same for the whole interval).'''
+    offsets = np.array((-error_px, 0, error_px))
+    x_from, y_from, x_to, y_to = (np.array(np.meshgrid(bounds[0] + offsets, bounds[1] + offsets, bounds[0] + bounds[2] + offsets, bounds[1] + bounds[3] + offsets)).reshape(4, -1))
+    candidates = np.stack((x_from, y_from, x_to - x_from, y_to - y_from), axis=1)
+
+    virtual_bounds = BoundFinder.find_virtual_bounds_batch(shape, candidates)
+    _, _, estimated_focal, _ = calculator.zoom_batch(virtual_bounds, calibration.camera_distance_mm)
+
+    lowest_focal, highest_focal = float(estimated_focal.min()), float(estimated_focal.max())
+    if not (np.isfinite(lowest_focal) and np.isfinite(highest_focal)):
+        return (lowest_focal, highest_focal, False)
+
+    # Same number of table focals below both ends: no focal boundary inside interval (and some lower focal exists)
+    lower_count = np.searchsorted(calculator.focal_table, (lowest_focal, highest_focal), side='left')
+    return (lowest_focal, highest_focal, bool(lower_count[0] == lower_count[1] and lower_count[0] > 0))
+
+
+def first_pass_bounds(calculator, calibration, segment_bounds, segment_mask, shape, offset, options):
+    '''Two-tier first pass on photos downscaled by options.first_pass_scale. offset is (x, y) of segmented photos in frame of shape.
+    Return (object bounds refined at full resolution or None when full path is needed, lowest focal mm, highest focal mm).'''
+    try:
+        coarse_bounds = segment_bounds.find_object_bounds_coarse(9, 100, options.first_pass_scale, segment_mask, options.bounds_engine)
+    except ValueError:
+        # Object is too small for coarse pass
+        return (None, None, None)
+
+    # Coarse filters spread the mask, move edges inwards
+    bias = int(round(options.first_pass_bias * options.first_pass_scale))
+    bounds = (coarse_bounds[0] + bias, coarse_bounds[1] + bias, max(coarse_bounds[2] - 2 * bias, 1), max(coarse_bounds[3] - 2 * bias, 1))
+    frame_bounds = (bounds[0] + offset[0], bounds[1] + offset[1], bounds[2], bounds[3])
+    error_px = options.first_pass_scale * options.first_pass_margin
+    lowest_focal, highest_focal, confident = focal_interval(calculator, calibration, shape, frame_bounds, error_px)
+    confident = confident and box_inside_mask(frame_bounds, shape, calibration.disc_circle, bias + error_px)
+    confident = confident and bounds[2] * bounds[3] >= FIRST_PASS_MIN_BOX_AREA
+    if not confident:
+        return (None, lowest_focal, highest_focal)
+
+    # Reported box and size come from full resolution edges (band check of pyramid mode), not from coarse estimate.
+    # Coarse blobs rejected at full resolution are left to full path
+    try:
+        bounds = segment_bounds.refine_object_bounds(coarse_bounds, 9, 100, options.first_pass_scale, segment_mask)
+    except ValueError:
+        return (None, lowest_focal, highest_focal)
+    return (bounds, lowest_focal, highest_focal)
+
+
+def process_object(calculator, calibration, object_image, bounding_image_path=None, write_zoom=False, options=None, arena=None, writer=None):
+    '''Find object bounds on object image and calculate zoom index using calibration products.
+    Optional buffer arena is used for in-place full resolution path.
+    Return dictionary with bounding boxes, object size and zoom index.'''
+    options = options if options is not None else ProcessingOptions()
+    result = {}
+
+    # Process object image and find boundings
+    object_bounds = BoundFinder(calculator.background_image, object_image)
+
+    # Crop photos and disc mask to work disc bounding square. Margin is wider than filter kernels, so mask inside disc does not change
+    roi = BoundFinder.disc_roi(calibration.disc_circle, object_image.shape, options.roi_margin) if options.roi_crop else None
+    if roi is not None:
+        x_from, y_from, x_to, y_to = roi
+        segment_bounds = BoundFinder(calculator.background_image[y_from:y_to, x_from:x_to], object_image[y_from:y_to, x_from:x_to])
+        segment_mask = calibration.disc_mask[y_from:y_to, x_from:x_to]
+    else:
+        x_from, y_from = 0, 0
+        segment_bounds = object_bounds
+        segment_mask = calibration.disc_mask
+
+    if options.segmentation == 'two_tier':
+        with metrics.stage('first_pass'):
+            bounds, lowest_focal, highest_focal = first_pass_bounds(calculator, calibration, segment_bounds, segment_mask, object_image.shape, (x_from, y_from), options)
+        result['focal_interval_mm'] = [lowest_focal, highest_focal]
+        result['escalated'] = bounds is None
+        metrics.count('first_pass_escalations' if bounds is None else 'first_pass_accepted')
+
+        if bounds is not None:
+            processed_photo_object = None
+        else:
+            bounds, processed_photo_object = reference_bounds(segment_bounds, segment_mask, arena, options.bounds_engine)
+    elif options.segmentation == 'pyramid':
+        bounds = segment_bounds.find_object_bounds_pyramid(9, 100, options.pyramid_scale, segment_mask, engine=options.bounds_engine)
+        processed_photo_object = None
+    elif options.segmentation == 'tiled':
+        bounds, processed_photo_object = segment_bounds.find_object_bounds_tiled(9, 100, options.tile_rows, segment_mask, options.bounds_engine,
+                                                                                 keep_mask=bounding_image_path is not None, arena=arena)
+    else:
+        bounds, processed_photo_object = reference_bounds(segment_bounds, segment_mask, arena, options.bounds_engine)
+
+    # Map bounds back to full frame coordinates
+    bounds = (bounds[0] + x_from, bounds[1] + y_from, bounds[2], bounds[3])
+
+    if processed_photo_object is not None and roi is not None and bounding_image_path is not None:
+        full_photo_object = np.zeros(object_image.shape[:2], np.uint8)
+        full_photo_object[y_from:y_to, x_from:x_to] = processed_photo_object
+        processed_photo_object = full_photo_object
+
+    if options.compare_full and (options.segmentation != 'full' or roi is not None or options.bounds_engine != 'contours'):
+        full_bounds, _ = reference_bounds(object_bounds, calibration.disc_mask)
+        result['full_object_bounds'] = list(full_bounds)
+        result['bounds_error_px'] = BoundFinder.bounds_error(full_bounds, bounds)
+        full_virtual_bounds = BoundFinder.find_virtual_bounds_batch(object_image.shape, full_bounds)
+        result['full_zoom_index'] = int(calculator.zoom_batch(full_virtual_bounds, calibration.camera_distance_mm)[3][0])
+
+    object_lower_x, object_lower_y, object_width_px, object_height_px = bounds
+
+    # Find big bounding box
+    big_bounding_lower_x, big_bounding_lower_y, big_bounding_wight, big_bounding_height = object_bounds.find_virtual_bounds(object_lower_x, object_lower_y, object_width_px, object_height_px)
+
+    #Save image
+    if bounding_image_path is not None:
+        # Coarse-to-fine and tiled components modes have no full resolution mask, draw box on object photo instead
+        bounding_image = cv2.cvtColor(processed_photo_object, cv2.COLOR_GRAY2BGR) if processed_photo_object is not None else object_image.copy()
+        cv2.rectangle(bounding_image, (big_bounding_lower_x, big_bounding_lower_y), (big_bounding_lower_x + big_bounding_wight, big_bounding_lower_y + big_bounding_height), (0, 255, 0), 3)
+        if writer is not None:
+            writer.imwrite(bounding_image_path, bounding_image)
+        else:
+            with metrics.stage('output_write'):
+                cv2.imwrite(bounding_image_path, bounding_image)
+
+    # Calculate real object size in mm
+    object_width_mm, object_height_mm = calculator.calculate_object_size(big_bounding_wight, big_bounding_height, calibration.camera_distance_mm)
+
+    # Calculate zoom index
+    zoom_index = calculator.calc_zoom(big_bounding_wight, big_bounding_height, object_width_mm, object_height_mm, calibration.camera_distance_mm, write_file=write_zoom)
+
+    result.update({
+        'object_bounds': [object_lower_x, object_lower_y, object_width_px, object_height_px],
+        'virtual_bounds': [big_bounding_lower_x, big_bounding_lower_y, big_bounding_wight, big_bounding_height],
+        'object_width_mm': object_width_mm,
+        'object_height_mm': object_height_mm,
+        'camera_distance_mm': calibration.camera_distance_mm,
+        'zoom_index': zoom_index,
+    })
+
+    return result
+
+
+class EscalationReport:
+    '''Escalation rate of two-tier segmentation and zoom agreement with full resolution path (results with full_zoom_index).'''
+    def __init__(self):
+        self.photos = 0
+        self.escalated = 0
+        self.compared = 0
+        self.agreed = 0
+        self.fast_compared = 0
+        self.fast_agreed = 0
+
+    def add(self, result):
+        '''Count one process_object() result (results without two-tier fields are skipped).'''
+        if 'escalated' not in result or 'zoom_index' not in result:
+            return
+        self.photos += 1
+        self.escalated += result['escalated']
+
+        if 'full_zoom_index' in result:
+            agreed = result['zoom_index'] == result['full_zoom_index']
+            self.compared += 1
+            self.agreed += agreed
+            if not result['escalated']:
+                self.fast_compared += 1
+                self.fast_agreed += agreed
+
+    def summary(self):
+        '''One line summary.'''
+        line = 'two-tier: {} photos, {} escalated ({:.1f}%)'.format(self.photos, self.escalated, 100.0 * self.escalated / self.photos if self.photos else 0.0)
+        if self.compared:
+            line += ', zoom agrees with full path for {} of {} ({} of {} first pass only)'.format(self.agreed, self.compared, self.fast_agreed, self.fast_compared)
+        return line
+
+
+class BatchProcessor:
+    '''Zoom calculator for stream of object photos sharing one calibration.'''
+    def __init__(self, calculator, calibration, bounding_image_dir=None, options=None, prefetch=0, writer=None):
+        self.calculator = calculator
+        self.calibration = calibration
+        self.bounding_image_dir = bounding_image_dir
+        self.options = options
+        # Tiled segmentation reuses strip buffers between photos too (first, middle and last strips differ in shape)
+        self.arena = BufferArena(max_shapes=3) if options is not None and (options.in_place or options.segmentation == 'tiled') else None
+
+        # Decode up to prefetch next photos on background threads, queue bounding image writes to writer (async_io.AsyncWriter)
+        self.prefetcher = ImagePrefetcher(prefetch) if prefetch else None
+        self.writer = writer
+
+    def process(self, path_to_object_image, serial_number):
+        '''Calculate zoom for one object photo. Errors are reported in result instead of stopping the batch.'''
+        with metrics.stage('image_load'):
+            object_image = cv2.imread(path_to_object_image)
+
+        return self.process_image(object_image, path_to_object_image, serial_number)
+
+    def process_image(self, object_image, path_to_object_image, serial_number):
+        '''Calculate zoom for already decoded object photo (None when photo could not be read).'''
+        result = {'obj': path_to_object_image, 'sn': serial_number}
+        if object_image is None:
+            result['error'] = 'File is not found'
+            return result
+
+        bounding_image_path = None
+        if self.bounding_image_dir is not None:
+            file_name = os.path.splitext(os.path.basename(path_to_object_image))[0]
+            bounding_image_path = os.path.join(self.bounding_image_dir, 'BoundingMask_' + file_name + '.jpg')
+
+        try:
+            result.update(process_object(self.calculator, self.calibration, object_image, bounding_image_path, options=self.options, arena=self.arena, writer=self.writer))
+        except CALCULATION_ERRORS as error:
+            result['error'] = str(error) or 'Calculation error'
+
+        return result
+
+    def run(self, entries):
+        '''Yield results for (object image path, serial number) pairs in order.
+        With prefetch, next photos are decoded while current one is processed.'''
+        if self.prefetcher is None:
+            for path_to_object_image, serial_number in entries:
+                yield self.process(path_to_object_image, serial_number)
+            return
+
+        for (path_to_object_image, serial_number), object_image in self.prefetcher.run(entries):
+            yield self.process_image(object_image, path_to_object_image, serial_number)
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,64 @@
+'''Re-score batch results: recalculate zoom indices of JSONL results for other fill factors without image processing.'''
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from camera_profiles import ProfileRegistry
+
+def read_results(path_to_results):
+    '''Return (records, virtual bounds (N, 4), camera distances (N,)) of successful batch results.'''
+    records = []
+    with open(path_to_results) as results_file:
+        for line in results_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'virtual_bounds' in record and 'camera_distance_mm' in record:
+                records.append(record)
+
+    bounds = np.array([record['virtual_bounds'] for record in records], dtype=float).reshape(-1, 4)
+    distances = np.array([record['camera_distance_mm'] for record in records], dtype=float)
+    return records, bounds, distances
+
+def main():
+    '''Re-score entry point'''
+    parser = argparse.ArgumentParser(description='Recalculate zoom indices of batch results for other fill factors')
+    parser.add_argument('--blue', type=str, required=True, help='Blue disc photo name (frame size and camera orientation)')
+    parser.add_argument('--results', type=str, required=True, help='JSONL results of batch.py')
+    parser.add_argument('--sn', type=str, default='None', help='Camera serial number for camera profile (default: None)')
+    parser.add_argument('--fill-factors', type=str, default='0.8', help='Comma separated parts of frame object must fill (default: 0.8)')
+    parser.add_argument('--output', type=str, default=None, help='JSONL file for re-scored results (default: summary only)')
+    args = parser.parse_args()
+
+    calculator = ProfileRegistry().calculator(args.sn)
+    calculator.path_to_calibration_image = args.blue
+    calculator.read_calibration_image()
+
+    if calculator.calibration_image is None:
+        print('File is not found')
+        sys.exit()
+
+    calculator.select_camera_orientation()
+    records, bounds, distances = read_results(args.results)
+    fill_factors = [float(value) for value in args.fill_factors.split(',')]
+
+    zoom_indices = {}
+    for fill_factor in fill_factors:
+        _, _, estimated_focal, zoom_index = calculator.zoom_batch(bounds, distances, fill_factor)
+        zoom_indices[fill_factor] = zoom_index
+        stored = np.array([record.get('zoom_index', 0) for record in records])
+        print('fill {:.2f}: {} photos, {} changed zoom, {} without lower focal, indices {}'.format(
+            fill_factor, len(records), int(np.count_nonzero(zoom_index != stored)), int(np.count_nonzero(zoom_index == 0)),
+            dict(zip(*[values.tolist() for values in np.unique(zoom_index, return_counts=True)]))))
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            for position, record in enumerate(records):
+                record = dict(record, zoom_by_fill_factor={str(fill_factor): int(zoom_indices[fill_factor][position]) for fill_factor in fill_factors})
+                output_file.write(json.dumps(record) + '\n')
+
+if __name__ == '__main__':
+    main()
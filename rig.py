@@ -0,0 +1,132 @@
+'''Multi-camera rig mode: calibrate and process shots of every camera concurrently, merge zoom indices into one zoom store.'''
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from camera_profiles import ProfileRegistry
+from pipeline import add_processing_arguments, calibrate, process_object, ProcessingOptions, CALCULATION_ERRORS
+from calibration_cache import CalibrationCache
+from decode import ImageDecoder
+from disc_tracker import DiscTracker, state_path
+from zoom_store import ZoomStore
+import metrics
+
+def read_rig_manifest(path_to_manifest):
+    '''Yield (serial number, calibration, background, object photo path) per camera from CSV/JSONL manifest
+    with "sn", "blue", "gray" and "obj" columns. Relative paths are resolved against manifest directory.'''
+    base_dir = os.path.dirname(os.path.abspath(path_to_manifest))
+
+    with open(path_to_manifest, newline='') as manifest_file:
+        if path_to_manifest.lower().endswith('.csv'):
+            records = csv.DictReader(manifest_file)
+        else:
+            records = (json.loads(line) for line in manifest_file if line.strip())
+
+        for record in records:
+            if not all(record.get(name) for name in ('sn', 'blue', 'gray', 'obj')):
+                continue
+            yield (str(record['sn']),) + tuple(os.path.join(base_dir, record[name]) for name in ('blue', 'gray', 'obj'))
+
+
+class RigProcessor:
+    '''Zoom calculation for set of cameras: every camera has own calibration, background and object photo.
+    Cameras are processed on thread pool (OpenCV releases GIL), each camera run is independent.'''
+    def __init__(self, registry, options=None, cache=None, tracker=None, decoder=None, bounding_image_dir=None):
+        self.registry = registry
+        self.options = options
+        self.cache = cache
+        self.tracker = tracker
+        self.decoder = decoder
+        self.bounding_image_dir = bounding_image_dir
+
+    def process_camera(self, serial_number, path_to_calibration_image, path_to_background_image, path_to_object_image):
+        '''Calibrate one camera and calculate zoom for its object photo. Errors are reported in result.'''
+        result = {'sn': serial_number, 'obj': path_to_object_image}
+
+        calculator = self.registry.calculator(serial_number)
+        calculator.decoder = self.decoder
+        calculator.load_images(path_to_calibration_image, path_to_background_image, path_to_object_image, serial_number, read_calibration=self.cache is None)
+
+        # Without calibration cache the calibration photo is read here too (with cache calibrate() reports it on cache miss)
+        missing_calibration = self.cache is None and calculator.calibration_image is None
+        if calculator.background_image is None or calculator.object_image is None or missing_calibration:
+            result['error'] = 'File is not found'
+            metrics.flush({'mode': 'rig', 'sn': serial_number})
+            return result
+
+        bounding_image_path = None
+        if self.bounding_image_dir is not None:
+            bounding_image_path = os.path.join(self.bounding_image_dir, 'BoundingMask_' + serial_number + '.jpg')
+
+        try:
+            calibration = calibrate(calculator, self.cache, self.tracker)
+            result.update(process_object(calculator, calibration, calculator.object_image, bounding_image_path, options=self.options))
+        except CALCULATION_ERRORS as error:
+            result['error'] = str(error) or 'Calculation error'
+
+        metrics.flush({'mode': 'rig', 'sn': serial_number})
+        return result
+
+    def run(self, cameras, workers=None):
+        '''Process (serial number, calibration, background, object path) cameras concurrently, return results in input order.'''
+        cameras = list(cameras)
+        with ThreadPoolExecutor(max_workers=workers or max(len(cameras), 1)) as executor:
+            return list(executor.map(lambda camera: self.process_camera(*camera), cameras))
+
+
+def main():
+    '''Rig mode entry point'''
+    parser = argparse.ArgumentParser(description='Multi-camera zoom calculation')
+    parser.add_argument('--manifest', type=str, default=None, help='CSV/JSONL manifest with sn, blue, gray and obj per camera')
+    parser.add_argument('--camera', type=str, nargs=4, action='append', default=[], metavar=('SN', 'BLUE', 'GRAY', 'OBJ'), help='Camera serial and its photos (repeatable)')
+    parser.add_argument('--store', type=str, default='zoom.conf', help='Zoom store file (default: zoom.conf)')
+    parser.add_argument('--output', type=str, default=None, help='JSONL file for per-camera results, "-" for stdout (default: not written)')
+    parser.add_argument('--workers', type=int, default=0, help='Cameras processed at once, 0 for all cameras (default: 0)')
+    parser.add_argument('--cache', type=str, default=None, help='Calibration cache directory (default: no cache)')
+    add_processing_arguments(parser, in_place=False)
+    parser.add_argument('--bounding-dir', type=str, default=None, help='Directory to save bounding mask images (default: not saved)')
+    args = parser.parse_args()
+
+    # Results on stdout are JSON lines only: prints of calculator and bound finder, errors and per-camera summary go to stderr
+    results_file = sys.stdout
+    if args.output == '-':
+        sys.stdout = sys.stderr
+
+    cameras = [tuple(camera) for camera in args.camera]
+    if args.manifest is not None:
+        cameras += list(read_rig_manifest(args.manifest))
+    if not cameras:
+        print('No cameras are given')
+        sys.exit()
+
+    metrics.enable_from_env()
+
+    options = ProcessingOptions.from_args(args)
+    processor = RigProcessor(ProfileRegistry(), options,
+                             cache=CalibrationCache(args.cache) if args.cache is not None else None,
+                             tracker=DiscTracker(state_path(args.cache)) if args.track_disc else None,
+                             decoder=ImageDecoder() if args.reduced_decode else None,
+                             bounding_image_dir=args.bounding_dir)
+
+    results = processor.run(cameras, args.workers or None)
+
+    # One store update for all cameras: short lock, atomic replace
+    ZoomStore(args.store).update({result['sn']: result['zoom_index'] for result in results if 'zoom_index' in result})
+
+    if args.output is not None:
+        output_file = results_file if args.output == '-' else open(args.output, 'w')
+        for result in results:
+            output_file.write(json.dumps(result) + '\n')
+        output_file.flush()
+        if output_file is not results_file:
+            output_file.close()
+
+    for result in results:
+        print('{}: {}'.format(result['sn'], result.get('zoom_index', result.get('error'))))
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,12 @@ import os
 
 class SettingsInit:
     '''Class with JSON settings reader'''
-    def __init__(self):
+    def __init__(self, path_to_settings='settings.json'):
         try:
             # Open settings file
 
             #path_to_settings = str(os.environ['SCANBOT_WORKDIR'] + '/bin/settings.json')
-            path_to_settings = str('settings.json')
+            path_to_settings = str(path_to_settings)
 
             with open(path_to_settings) as settings_file:
                 json_dict = json.load(settings_file)
@@ -28,25 +28,31 @@ class SettingsInit:
         self.sensor_height_mm = float(json_dict['SENSOR_HEIGHT_MM'])
         self.sensor_wight_px = int(json_dict['SENSOR_WIGHT_PX'])
         self.sensor_height_px = int(json_dict['SENSOR_HEIGHT_PX'])
-        self.possible_focal_length = tuple(json_dict['POSSIBLE_FOCAL_G9'])
+        # Focal table of default camera profile (see camera_profiles for per camera profiles)
+        self.possible_focal_length = tuple(json_dict.get('POSSIBLE_FOCAL_' + str(json_dict.get('DEFAULT_PROFILE')), json_dict['POSSIBLE_FOCAL_G9']))
 
 
     @staticmethod
-    def modify(parameter_name, new_value):
+    def modify(parameter_name, new_value, path_to_settings='settings.json'):
         '''Modify settings'''
-
-        with open('settings.json', 'w') as settings_file:
+        try:
             # Load JSON
-            json_dict = json.load(settings_file)
+            with open(path_to_settings) as settings_file:
+                json_dict = json.load(settings_file)
 
-            # Write new or old parameter
-            json_dict[parameter_name] = new_value
+        except FileNotFoundError:
+            # If file is not found
+            print('Settings file is not found')
+            sys.exit()
 
-            # Write into file
-            json.dump(json_dict, settings_file)
+        # Write new or old parameter
+        json_dict[parameter_name] = new_value
 
-            # Close file
-            settings_file.close()
+        # Write into temporary file and replace settings at once: readers (camera_profiles.ProfileRegistry) never see partial file
+        temp_path = path_to_settings + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'w') as settings_file:
+            json.dump(json_dict, settings_file, indent=4)
+        os.replace(temp_path, path_to_settings)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,139 @@
+'''Equivalence checks of optimized segmentation paths against reference binarization on synthetic photos.'''
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bounds import BoundFinder
+from arena import BufferArena
+
+def synthetic_photos(width, height, seed=0, noise=6):
+    '''Return (background, object) BGR photos: gray disc on dark rig, object photo adds few colored blobs
+    and small specks. Sensor noise differs between photos.'''
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 40, np.uint8)
+    cv2.circle(background, (width // 2, height // 2), int(0.45 * min(width, height)), (170, 170, 170), -1)
+
+    obj = background.copy()
+    cv2.rectangle(obj, (width // 3, height // 3), (2 * width // 3, 3 * height // 5), (30, 120, 220), -1)
+    cv2.circle(obj, (width // 3, 2 * height // 3), min(width, height) // 10, (20, 60, 110), -1)
+    # U shape: arms are separate in upper rows and joined at the bottom
+    cv2.rectangle(obj, (width // 10, height // 5), (width // 10 + 12, height // 2), (90, 200, 90), -1)
+    cv2.rectangle(obj, (width // 10 + 30, height // 5), (width // 10 + 42, height // 2), (90, 200, 90), -1)
+    cv2.rectangle(obj, (width // 10, height // 2 - 10), (width // 10 + 42, height // 2), (90, 200, 90), -1)
+    for x, y in rng.integers(0, min(width, height), (20, 2)):
+        cv2.circle(obj, (int(x), int(y)), int(rng.integers(1, 4)), (250, 250, 250), -1)
+
+    return tuple(cv2.add(photo, rng.integers(0, noise + 1, photo.shape, dtype=np.uint8)) for photo in (background, obj))
+
+def hollow_photos(width, height, seed=0, noise=6):
+    '''Return (background, object) BGR photos with ring outline object: about 2100 px of mask enclosing about 3900 px.'''
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 40, np.uint8)
+    cv2.circle(background, (width // 2, height // 2), int(0.45 * min(width, height)), (170, 170, 170), -1)
+
+    obj = background.copy()
+    cv2.circle(obj, (width // 2 + 5, height // 2), 30, (30, 120, 220), 5)
+
+    return tuple(cv2.add(photo, rng.integers(0, noise + 1, photo.shape, dtype=np.uint8)) for photo in (background, obj))
+
+def random_mask(rng, width=160, height=120):
+    '''Binarized mask with outlines, filled rectangles and lines (some of them cut by frame border) and noise specks.'''
+    mask = np.zeros((height, width), np.uint8)
+    for _ in range(rng.integers(1, 8)):
+        kind, size = rng.integers(0, 3), int(rng.integers(5, 45))
+        x, y = (int(value) for value in rng.integers(-20, width + 10, 2))
+        if kind == 0:
+            cv2.circle(mask, (x, y), size, 255, int(rng.integers(1, 4)))
+        elif kind == 1:
+            cv2.rectangle(mask, (x, y), (x + size, y + size // 2), 255, -1)
+        else:
+            cv2.line(mask, (x, y), (x + size, y + size), 255, int(rng.integers(1, 3)))
+    mask[rng.random(mask.shape) < 0.01] = 255
+    return mask
+
+def bounds_or_error(function, *args, **kwargs):
+    '''Bounds returned by function or "error" when no object is found.'''
+    try:
+        return function(*args, **kwargs)
+    except ValueError:
+        return 'error'
+
+@pytest.mark.parametrize('width, height', [(320, 240), (241, 317), (64, 48)])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_binarize_into_equals_binarize(width, height, seed):
+    background, obj = synthetic_photos(width, height, seed)
+    arena = BufferArena()
+
+    expected = BoundFinder.binarize(obj, background, 9, 100)
+    # Second call reuses arena buffers left from previous photo
+    BoundFinder.binarize_into(background, obj, 9, 100, arena)
+    mask = BoundFinder.binarize_into(obj, background, 9, 100, arena)
+
+    assert mask.shape == expected.shape and mask.dtype == expected.dtype
+    assert np.array_equal(mask, expected)
+
+def test_binarize_into_equals_binarize_on_crops():
+    background, obj = synthetic_photos(320, 240)
+    arena = BufferArena(max_shapes=3)
+
+    # Non-contiguous views, as used by ROI and tiled paths
+    for rows, columns in ((slice(10, 200), slice(30, 290)), (slice(0, 17), slice(0, 320)), (slice(100, 240), slice(5, 6))):
+        expected = BoundFinder.binarize(obj[rows, columns], background[rows, columns], 9, 100)
+        mask = BoundFinder.binarize_into(obj[rows, columns], background[rows, columns], 9, 100, arena)
+        assert np.array_equal(mask, expected)
+
+def test_binarize_into_empty_and_full_difference():
+    background = np.full((48, 64, 3), 120, np.uint8)
+    arena = BufferArena()
+
+    for obj in (background.copy(), np.full_like(background, 250)):
+        assert np.array_equal(BoundFinder.binarize_into(obj, background, 9, 100, arena), BoundFinder.binarize(obj, background, 9, 100))
+
+def test_components_engine_keeps_hollow_objects():
+    # Ring of about 770 px enclosing about 5000 px: contour area is above min_area, pixel count is not
+    mask = np.zeros((400, 400), np.uint8)
+    cv2.circle(mask, (200, 200), 40, 255, 2)
+    assert np.count_nonzero(mask) < 1000
+
+    finder = BoundFinder(None, None)
+    assert finder.find_object_bounds(mask, engine='components') == finder.find_object_bounds(mask)
+
+def test_components_engine_equals_contours():
+    rng = np.random.default_rng(0)
+    finder = BoundFinder(None, None)
+
+    for _ in range(200):
+        mask = random_mask(rng)
+        expected = bounds_or_error(finder.find_object_bounds, mask, 300)
+        assert bounds_or_error(finder.find_object_bounds, mask, 300, engine='components') == expected
+
+@pytest.mark.parametrize('engine', ['contours', 'components'])
+@pytest.mark.parametrize('with_mask', [False, True], ids=['no_mask', 'disc_mask'])
+@pytest.mark.parametrize('photos, min_area', [(synthetic_photos, 1000), (hollow_photos, 2500)], ids=['blobs', 'hollow'])
+def test_tiled_bounds_and_mask_equal_full_path(engine, with_mask, photos, min_area):
+    width, height = 160, 120
+    background, obj = photos(width, height)
+    mask = None
+    if with_mask:
+        mask = np.zeros((height, width), np.uint8)
+        cv2.circle(mask, (width // 2, height // 2), int(0.45 * min(width, height)), 255, -1)
+
+    expected_mask = BoundFinder.binarize(obj, background, 9, 100)
+    if mask is not None:
+        expected_mask = cv2.bitwise_and(expected_mask, mask)
+    finder = BoundFinder(background, obj)
+    # Reference contours engine for both engines
+    expected_bounds = finder.find_object_bounds(expected_mask, min_area)
+
+    # Every strip height: seams at every row, strips shorter than filter halo and single strip
+    arena = BufferArena(max_shapes=3)
+    for tile_rows in range(1, height + 2):
+        bounds, tiled_mask = finder.find_object_bounds_tiled(9, 100, tile_rows, mask, engine, keep_mask=True, min_area=min_area, arena=arena)
+        assert bounds == expected_bounds, tile_rows
+        assert np.array_equal(tiled_mask, expected_mask), tile_rows
@@ -0,0 +1,40 @@
+'''Live tracker checks on synthetic frames.'''
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bounds import BoundFinder
+from camera_profiles import CameraProfile
+from live import LiveTracker
+from pipeline import Calibration
+from zoom import Calculator
+
+def test_live_tracker_emits_zoom_for_hollow_object():
+    width, height = 320, 240
+    rng = np.random.default_rng(0)
+    background = np.full((height, width, 3), 40, np.uint8)
+    cv2.circle(background, (width // 2, height // 2), 108, (170, 170, 170), -1)
+    # Ring outline: mask pixel count is below min_area, its outer contour area is not
+    frame = background.copy()
+    cv2.circle(frame, (width // 2 + 10, height // 2), 30, (30, 120, 220), 5)
+    background, frame = (cv2.add(photo, rng.integers(0, 7, photo.shape, dtype=np.uint8)) for photo in (background, frame))
+
+    calculator = Calculator.from_profile(CameraProfile.build('G9', 7.6, 6.1, 1600, 1200, 0.3, [8.2, 9.0, 9.9, 10.7, 12.7, 14.8, 16.8, 18.9, 22.0, 25.0, 29.2, 36.8, 44.4]))
+    calculator.calibration_shape = (height, width, 3)
+    calculator.background_image = background
+    calibration = Calibration(500.0, 90.0, None, (height, width))
+    tracker = LiveTracker.for_frames(calculator, calibration, frame.shape, stable_frames=3, min_area=3000)
+
+    mask = cv2.bitwise_and(BoundFinder.binarize(frame, background, 9, 100), calibration.disc_mask)
+    assert np.count_nonzero(mask) < 3000
+
+    results = [tracker.process_frame(frame) for _ in range(3)]
+    assert results[:2] == [None, None]
+    assert results[2] is not None
+    assert tuple(results[2]['object_bounds']) == BoundFinder(background, frame).find_object_bounds(mask, 3000)
+    assert results[2]['zoom_index'] > 0
@@ -0,0 +1,70 @@
+'''Equivalence checks of vectorized zoom math against scalar Calculator methods.'''
+
+import itertools
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera_profiles import compile_profiles
+from zoom import Calculator
+
+SETTINGS = {
+    'DISC_DIAMETER_M': 0.3,
+    'SENSOR_WIGHT_MM': 7.6,
+    'SENSOR_HEIGHT_MM': 6.1,
+    'SENSOR_WIGHT_PX': 1600,
+    'SENSOR_HEIGHT_PX': 1200,
+    'POSSIBLE_FOCAL_G10': [6.785, 7.407, 8.108, 8.898, 9.784, 10.775, 12.074, 13.761, 15.673, 18.098, 21.461, 24.978, 30.5],
+    'POSSIBLE_FOCAL_G9': [8.2, 9.0, 9.9, 10.7, 12.7, 14.8, 16.8, 18.9, 22.0, 25.0, 29.2, 36.8, 44.4],
+}
+
+def make_calculator(name, calibration_shape):
+    '''Calculator of settings profile name with camera orientation selected for calibration photo shape.'''
+    profiles, _, _ = compile_profiles(SETTINGS)
+    calculator = Calculator.from_profile(profiles[name])
+    calculator.calibration_shape = calibration_shape
+    calculator.select_camera_orientation()
+    return calculator
+
+def scalar_zoom(calculator, width_px, height_px, distance):
+    '''Reference chain: calculate_object_size() and calc_zoom(). Zoom index 0 where calc_zoom finds no lower focal.'''
+    width_mm, height_mm = calculator.calculate_object_size(width_px, height_px, distance)
+    try:
+        zoom_index = calculator.calc_zoom(width_px, height_px, width_mm, height_mm, distance, write_file=False)
+    except ValueError:
+        zoom_index = 0
+    return width_mm, height_mm, zoom_index
+
+@pytest.mark.parametrize('name', ['G9', 'G10'])
+@pytest.mark.parametrize('calibration_shape', [(3000, 4000, 3), (4000, 3000, 3)], ids=['landscape', 'portrait'])
+def test_zoom_batch_matches_scalar_path(name, calibration_shape):
+    calculator = make_calculator(name, calibration_shape)
+
+    sizes = [1, 37, 120, 333, 800, 1500, 2999]
+    distances = [150.0, 420.5, 900.0, 2500.0]
+    cases = list(itertools.product(sizes, sizes, distances))
+
+    bounds = np.array([(10, 20, width, height) for width, height, _ in cases], dtype=float)
+    distance = np.array([case[2] for case in cases])
+    width_mm, height_mm, _, zoom_index = calculator.zoom_batch(bounds, distance)
+
+    expected = np.array([scalar_zoom(calculator, width, height, distance) for width, height, distance in cases])
+    np.testing.assert_allclose(width_mm, expected[:, 0], rtol=1e-12)
+    np.testing.assert_allclose(height_mm, expected[:, 1], rtol=1e-12)
+    assert np.array_equal(zoom_index, expected[:, 2].astype(int))
+    # Cases cover both found focals and focals lower than the whole table
+    assert (zoom_index > 0).any() and (zoom_index == 0).any()
+
+@pytest.mark.parametrize('name', ['G9', 'G10'])
+def test_zoom_batch_scalar_distance(name):
+    calculator = make_calculator(name, (3000, 4000, 3))
+    bounds = [(0, 0, 400, 300), (5, 5, 1200, 900)]
+
+    width_mm, height_mm, _, zoom_index = calculator.zoom_batch(bounds, 600.0)
+
+    for (_, _, width, height), width_value, height_value, index in zip(bounds, width_mm, height_mm, zoom_index):
+        assert (width_value, height_value, index) == pytest.approx(scalar_zoom(calculator, width, height, 600.0), rel=1e-12)
@@ -5,23 +5,66 @@ import math
 import argparse
 
 import cv2
+import numpy as np
+
+from async_io import read_images
+from decode import ImageDecoder
+from zoom_store import ZoomStore
+from camera_profiles import CameraProfile
+import metrics
 
 class Calculator:
     '''Main zoom calculator class.'''
-    def __init__(self, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length):
-        self.sensor_wight_mm = sensor_wight_mm
-        self.sensor_height_mm = sensor_height_mm
-        self.sensor_wight_px = sensor_wight_px
-        self.sensor_height_px = sensor_height_px
-        self.disc_diameter_m = disc_diameter_m
+    def __init__(self, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length, profile=None):
+        # Compiled camera profile (camera_profiles.CameraProfile) with derived constants, built here for plain values
+        if profile is None:
+            profile = CameraProfile.build(None, sensor_wight_mm, sensor_height_mm, sensor_wight_px, sensor_height_px, disc_diameter_m, possible_focal_length)
+        self.set_profile(profile)
 
         self.calibration_image = None
         self.background_image = None
         self.object_image = None
         self.serial_number = None
 
+        self.path_to_calibration_image = None
+        self.path_to_background_image = None
+        self.calibration_shape = None
+        self.cache_dir = None
+        self.track_disc = False
+
+        # Optional decode.ImageDecoder: calibration photo is decoded at reduced resolution, calibration_scale maps its pixels to full resolution
+        self.decoder = None
+        self.calibration_scale = 1
+
         self.zoom_index = 0
-        self.possible_focal_length = possible_focal_length
+
+    @classmethod
+    def from_profile(cls, profile):
+        '''Calculator for compiled camera profile (see camera_profiles.ProfileRegistry).'''
+        return cls(profile.sensor_wight_mm, profile.sensor_height_mm, profile.sensor_wight_px, profile.sensor_height_px,
+                   profile.disc_diameter_m, profile.possible_focal_length, profile)
+
+    def set_profile(self, profile):
+        '''Use compiled camera profile. Sensor orientation is selected again by select_camera_orientation().'''
+        self.profile = profile
+        self._apply_profile(profile)
+
+    def _apply_profile(self, profile):
+        '''Copy sensor, disc and focal values of compiled profile (or its orientation variant).'''
+        self.sensor_wight_mm = profile.sensor_wight_mm
+        self.sensor_height_mm = profile.sensor_height_mm
+        self.sensor_wight_px = profile.sensor_wight_px
+        self.sensor_height_px = profile.sensor_height_px
+        self.disc_diameter_m = profile.disc_diameter_m
+        self.possible_focal_length = profile.possible_focal_length
+
+        # Sensor pixel density (px/mm)
+        self.px_dest_wight = profile.px_dest_wight
+        self.px_dest_height = profile.px_dest_height
+
+        # Sorted focal lookup table for batch zoom calculation: focal_order maps sorted position to zoom index - 1
+        self.focal_order = profile.focal_order
+        self.focal_table = profile.focal_table
 
     def select_images(self):
         '''Get calibration, background and obrect image(temp funciton).'''
@@ -33,39 +76,76 @@ class Calculator:
             parser.add_argument('--gray', type=str, default='None', help='Gray disc photo name (default: None)')
             parser.add_argument('--obj', type=str, default='None', help='Object photo name (default: None)')
             parser.add_argument('--sn', type=str, default='None', help='Camera serial number (default: None)')
+            parser.add_argument('--cache', type=str, default=None, help='Calibration cache directory (default: no cache)')
+            parser.add_argument('--reduced-decode', action='store_true', help='Decode calibration and Hough photos at half resolution')
+            parser.add_argument('--track-disc', action='store_true', help='Reuse last work disc circle of camera while it matches background')
             args = parser.parse_args()
+            self.cache_dir = args.cache
+            self.track_disc = args.track_disc
+            if args.reduced_decode:
+                self.decoder = ImageDecoder()
 
-            # Generate path to the selected files
-            path_to_calibration_image = str(args.blue)
-            path_to_background_image = str(args.gray)
-            path_to_object_image = str(args.obj)
-
-            # Read the images with OpenCV and save calibration and background image
-            self.calibration_image = cv2.imread(path_to_calibration_image)
-            self.background_image = cv2.imread(path_to_background_image)
-            self.object_image = cv2.imread(path_to_object_image)
-            self.serial_number = str(args.sn)
+            # Generate path to the selected files and read them. With calibration cache, calibration image is read only on cache miss
+            self.load_images(str(args.blue), str(args.gray), str(args.obj), str(args.sn), read_calibration=self.cache_dir is None)
 
         except FileNotFoundError:
             print('File is not found')
             sys.exit()
 
+    @metrics.timed('image_load')
+    def load_images(self, path_to_calibration_image, path_to_background_image, path_to_object_image=None, serial_number='None', read_calibration=True):
+        '''Read calibration, background and (optional) object image from given paths.'''
+        self.path_to_calibration_image = path_to_calibration_image
+        self.path_to_background_image = path_to_background_image
+
+        # Decode the images with OpenCV on parallel threads and save calibration and background image
+        if self.decoder is None:
+            calibration_image, self.background_image, self.object_image = read_images(
+                (path_to_calibration_image if read_calibration else None, path_to_background_image, path_to_object_image))
+        else:
+            calibration_image, self.background_image, self.object_image = self.decoder.read_many(
+                ((path_to_calibration_image, 'calibration') if read_calibration else None, (path_to_background_image, 'color'),
+                 (path_to_object_image, 'color', False) if path_to_object_image is not None else None))
+        if read_calibration:
+            self.set_calibration_image(calibration_image)
+        self.serial_number = str(serial_number)
+
+    @metrics.timed('image_load')
+    def read_calibration_image(self):
+        '''Read calibration image and save its shape for pixel density calculations.'''
+        if self.decoder is None:
+            self.set_calibration_image(cv2.imread(self.path_to_calibration_image))
+        else:
+            self.set_calibration_image(self.decoder.read(self.path_to_calibration_image, 'calibration'))
+
+    def set_calibration_image(self, calibration_image):
+        '''Save decoded calibration image with full resolution shape and scale of decoded pixels.'''
+        self.calibration_image = calibration_image
+        if calibration_image is None:
+            self.calibration_shape = None
+        elif self.decoder is None:
+            self.calibration_shape = calibration_image.shape
+            self.calibration_scale = 1
+        else:
+            self.calibration_shape = self.decoder.full_shape(self.path_to_calibration_image, calibration_image, 'calibration')
+            self.calibration_scale = self.decoder.scale('calibration')
+
     def select_camera_orientation(self):
         '''Select camera orientation'''
-        height, width, _ = self.calibration_image.shape
+        height, width = self.calibration_shape[:2]
 
-        if height > width:
-            self.sensor_wight_mm, self.sensor_height_mm = self.sensor_height_mm, self.sensor_wight_mm
-            self.sensor_wight_px, self.sensor_height_px = self.sensor_height_px, self.sensor_wight_px
+        # Portrait photo: precompiled variant with swapped sensor sides
+        self._apply_profile(self.profile.rotated if height > width else self.profile)
 
 
+    @metrics.timed('zoom_math')
     def calculate_camera_distance(self, calibration_wight_px, calibration_height_px):
         '''Get distance to blue disc, mm.'''
         try:
 
             #Find pixel destiny
-            px_dest_wight = self.calibration_image.shape[0]/self.sensor_wight_mm
-            px_dest_height = self.calibration_image.shape[1]/self.sensor_height_mm
+            px_dest_wight = self.calibration_shape[0]/self.sensor_wight_mm
+            px_dest_height = self.calibration_shape[1]/self.sensor_height_mm
 
             # Calculate disc width/height on sensor (mm)
             disc_width_on_sensor = calibration_wight_px/px_dest_wight
@@ -84,12 +164,13 @@ class Calculator:
 
         return mean_distance
 
+    @metrics.timed('zoom_math')
     def calculate_object_size(self, object_width_px, object_height_px, distance_to_object):
         '''Calculate object size.'''
         try:
             #Find pixel destiny
-            px_dest_wight = self.calibration_image.shape[0] / self.sensor_wight_mm
-            px_dest_height = self.calibration_image.shape[1] / self.sensor_height_mm
+            px_dest_wight = self.calibration_shape[0] / self.sensor_wight_mm
+            px_dest_height = self.calibration_shape[1] / self.sensor_height_mm
 
             # Calculate object width/height on sensor (mm)
             object_width_on_sensor = object_width_px / px_dest_wight
@@ -105,6 +186,7 @@ class Calculator:
 
         return (object_width, object_height)
 
+    @metrics.timed('zoom_math')
     def calculate_camera_angle(self, calibration_wight, calibration_height):
         '''Get camera angle using calibration object wight and height.'''
         # Try to calculate angle
@@ -125,12 +207,13 @@ class Calculator:
             print('Calculation error (object size)')
             sys.exit()
 
-    def calc_zoom(self, object_width_px, object_height_px, object_width_mm, object_height_mm, distance_to_object):
-        '''Get proper zoom value'''
+    @metrics.timed('zoom_math')
+    def calc_zoom(self, object_width_px, object_height_px, object_width_mm, object_height_mm, distance_to_object, write_file=True):
+        '''Get proper zoom value. If write_file is set, zoom index is also written into zoom.conf'''
         try:
-            #Find pixel destiny
-            px_dest_wight = self.sensor_wight_px / self.sensor_wight_mm
-            px_dest_height = self.sensor_height_px / self.sensor_height_mm
+            #Pixel destiny of profile
+            px_dest_wight = self.px_dest_wight
+            px_dest_height = self.px_dest_height
 
             # Calculate estimated object width/height on sensor (mm). Object must fill 80% of image
             object_height_on_sensor = 0.8 * self.sensor_height_px / px_dest_height
@@ -167,11 +250,79 @@ class Calculator:
         #print('Camera focal is {}. Zoom index is {}.'.format(focal, zoom_index))
 
         #write zoom into file
-        zoomfile = open('zoom.conf', 'w')
-        zoomfile.write(self.serial_number + '=' + str(zoom_index))
-        zoomfile.close()
+        if write_file:
+            self.write_zoom(zoom_index)
 
         return zoom_index
 
+    def calculate_object_size_batch(self, object_width_px, object_height_px, distance_to_object):
+        '''Vectorized calculate_object_size() for arrays of bounding box sizes and distances. Return (widths mm, heights mm).'''
+        object_width_px = np.asarray(object_width_px, dtype=float)
+        object_height_px = np.asarray(object_height_px, dtype=float)
+        distance_to_object = np.asarray(distance_to_object, dtype=float)
+
+        #Find pixel destiny
+        px_dest_wight = self.calibration_shape[0] / self.sensor_wight_mm
+        px_dest_height = self.calibration_shape[1] / self.sensor_height_mm
+
+        # Calculate real object size (mm), same operation order as in calculate_object_size
+        focal = self.possible_focal_length[0]
+        object_width = (object_width_px / px_dest_wight) * (distance_to_object - focal) / focal
+        object_height = (object_height_px / px_dest_height) * (distance_to_object - focal) / focal
+        return (object_width, object_height)
+
+    def calc_zoom_batch(self, object_width_px, object_height_px, object_width_mm, object_height_mm, distance_to_object, fill_factor=0.8):
+        '''Vectorized calc_zoom() without zoom.conf writing. Object must fill fill_factor of image (0.8 in calc_zoom).
+        Return arrays (used object size mm, estimated focal mm, zoom index). Zoom index is 0 where there is no
+        focal lower than estimated one (calc_zoom fails there) or where estimation is not finite.'''
+        object_width_px = np.asarray(object_width_px, dtype=float)
+        object_height_px = np.asarray(object_height_px, dtype=float)
+        object_width_mm = np.asarray(object_width_mm, dtype=float)
+        object_height_mm = np.asarray(object_height_mm, dtype=float)
+        distance_to_object = np.asarray(distance_to_object, dtype=float)
+
+        #Pixel destiny of profile
+        px_dest_wight = self.px_dest_wight
+        px_dest_height = self.px_dest_height
+
+        # Estimated object width/height on sensor (mm), computed as in calc_zoom to get same focals
+        object_height_on_sensor = fill_factor * self.sensor_height_px / px_dest_height
+        object_wight_on_sensor = fill_factor * self.sensor_wight_px / px_dest_wight
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Select used side of object, same rules as in calc_zoom
+            if self.sensor_wight_px > self.sensor_height_px:
+                use_width = (object_width_px > object_height_px) & (object_width_px / object_height_px > self.sensor_wight_mm / self.sensor_height_mm)
+            else:
+                use_width = ~((object_width_px < object_height_px) & (object_height_px / object_width_px > self.sensor_height_mm / self.sensor_wight_mm))
+
+            object_size_on_sensor = np.where(use_width, object_wight_on_sensor, object_height_on_sensor)
+            object_size_mm = np.where(use_width, object_width_mm, object_height_mm)
+
+            # Calculate estimated focal (mm)
+            estimated_focal = (object_size_on_sensor * distance_to_object) / (object_size_mm + object_size_on_sensor)
+
+        # Closest lower focal: number of table focals lower than estimated one is position of closest lower focal + 1
+        lower_count = np.searchsorted(self.focal_table, estimated_focal, side='left')
+        valid = (lower_count > 0) & np.isfinite(estimated_focal)
+        zoom_index = np.where(valid, self.focal_order[np.maximum(lower_count - 1, 0)] + 1, 0)
+
+        return (object_size_mm, estimated_focal, zoom_index)
+
+    def zoom_batch(self, bounds, distance_to_object, fill_factor=0.8):
+        '''Zoom indices for array of (x, y, width, height) virtual bounding boxes and camera distances.
+        Return arrays (object widths mm, object heights mm, estimated focal mm, zoom index).'''
+        bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+        object_width_mm, object_height_mm = self.calculate_object_size_batch(bounds[:, 2], bounds[:, 3], distance_to_object)
+        _, estimated_focal, zoom_index = self.calc_zoom_batch(bounds[:, 2], bounds[:, 3], object_width_mm, object_height_mm, distance_to_object, fill_factor)
+        return (object_width_mm, object_height_mm, estimated_focal, zoom_index)
+
+    @metrics.timed('output_write')
+    def write_zoom(self, zoom_index, serial_number=None):
+        '''Write zoom index for camera serial number into zoom.conf (entries of other cameras are kept)'''
+        serial_number = self.serial_number if serial_number is None else serial_number
+
+        ZoomStore('zoom.conf').update({serial_number: zoom_index})
+
 if __name__ == '__main__':
     pass
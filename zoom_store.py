@@ -0,0 +1,54 @@
+'''Zoom store: zoom.conf with one "serial=index" line per camera, safe for concurrent writers.'''
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (non-POSIX): updates are still atomic, but concurrent updates may lose entries
+    fcntl = None
+
+class ZoomStore:
+    '''Merged zoom indices of all cameras. Readers see old or new file only (atomic rename),
+    writers hold lock file only while tiny file is read, merged and replaced.'''
+    def __init__(self, path_to_store='zoom.conf'):
+        self.path_to_store = path_to_store
+
+    def read(self):
+        '''Return {serial number: zoom index} (missing file gives empty store).'''
+        entries = {}
+        try:
+            with open(self.path_to_store) as store_file:
+                for line in store_file:
+                    serial_number, separator, zoom_index = line.strip().rpartition('=')
+                    if separator and serial_number:
+                        try:
+                            entries[serial_number] = int(zoom_index)
+                        except ValueError:
+                            continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def update(self, entries):
+        '''Merge {serial number: zoom index} into store. Return merged store.'''
+        with open(self.path_to_store + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                merged = self.read()
+                merged.update({str(serial_number): int(zoom_index) for serial_number, zoom_index in entries.items()})
+
+                temp_path = '{}.{}.{}.tmp'.format(self.path_to_store, os.getpid(), threading.get_ident())
+                with open(temp_path, 'w') as store_file:
+                    store_file.write(''.join('{}={}\n'.format(serial_number, zoom_index) for serial_number, zoom_index in sorted(merged.items())))
+                os.replace(temp_path, self.path_to_store)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return merged
+
+if __name__ == '__main__':
+    pass